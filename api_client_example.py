@@ -48,6 +48,66 @@ class CaelioAPIClient:
         )
         return response.json()
     
+    def discover_batch(self, answer_sets, top_n=20):
+        """
+        Phân tích + gợi ý sách cho nhiều bộ câu trả lời trong một request
+        answer_sets: list các dict giống /discover
+        """
+        response = requests.post(
+            f"{self.base_url}/discover/batch",
+            json={"answer_sets": answer_sets},
+            params={"top_n": top_n}
+        )
+        return response.json()
+    
+    def professional_batch(self, answer_sets, top_n=20):
+        """
+        Gợi ý sách chuyên ngành cho nhiều bộ câu trả lời trong một request
+        answer_sets: list các dict Q1-Q4 giống /professional
+        """
+        response = requests.post(
+            f"{self.base_url}/professional/batch",
+            json={"answer_sets": answer_sets},
+            params={"top_n": top_n}
+        )
+        return response.json()
+    
+    def iter_books(self, **filters):
+        """
+        Duyệt toàn bộ sách khớp bộ lọc qua stream NDJSON (không phân trang)
+        filters: category, author, title
+        """
+        params = dict(filters, format="ndjson")
+        with requests.get(f"{self.base_url}/books", params=params, stream=True) as response:
+            lines = response.iter_lines()
+            next(lines)  # dòng đầu: {"total": ...}
+            for line in lines:
+                yield json.loads(line)
+
+    def start_session(self):
+        """Tạo phiên làm bài, trả về trạng thái phiên (có session_id)"""
+        response = requests.post(f"{self.base_url}/sessions")
+        return response.json()
+
+    def answer_session(self, session_id, answers):
+        """
+        Gửi một hoặc vài câu trả lời cho phiên, ví dụ {"Q1": "C"}
+        Trả về trạng thái phiên kèm profile tạm thời
+        """
+        response = requests.patch(
+            f"{self.base_url}/sessions/{session_id}/answers",
+            json=answers
+        )
+        return response.json()
+
+    def session_recommendations(self, session_id, top_n=20):
+        """Gợi ý sách cho phiên đã trả lời đủ 8 câu"""
+        response = requests.get(
+            f"{self.base_url}/sessions/{session_id}/recommendations",
+            params={"top_n": top_n}
+        )
+        return response.json()
+
     def get_personality_groups(self):
         """Lấy danh sách nhóm tính cách"""
         response = requests.get(f"{self.base_url}/groups")
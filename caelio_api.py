@@ -3,14 +3,25 @@ Caelio Web API - REST API cho hệ thống phân loại tính cách đọc sách
 Sử dụng FastAPI
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
-import pandas as pd
 import os
+import base64
+import json
+import time
 from caelio_personality_system import CaelioPersonalitySystem
+from caelio_atlas import ensure_atlas
 from caelio_book_matcher import CaelioBookMatcher
+from caelio_catalog import CatalogWatcher, get_catalog
+from caelio_recommender import category_distribution
+from caelio_records import render_json
+from caelio_sessions import PREFETCH_TOP_N, FinalAnswerPrefetch, SessionStore
+from caelio_workers import AdmissionControl, EventLoopLagMonitor, configure_worker_threads
 
 # Khởi tạo FastAPI app
 app = FastAPI(
@@ -32,6 +43,26 @@ app.add_middleware(
 personality_system = CaelioPersonalitySystem()
 book_matcher = CaelioBookMatcher()
 
+# Atlas profile (memory-map) cho bộ 8 câu trả lời, load lúc khởi động; None thì tính điểm như cũ
+profile_atlas = None
+
+# Phiên làm bài khám phá từng câu (POST /sessions)
+session_store = SessionStore(personality_system)
+
+# Theo dõi file dữ liệu để reload catalog mà không cần restart server
+catalog_watcher = None
+
+# Endpoint nặng CPU chạy trong thread pool có giới hạn; event loop chỉ nhận request và đo độ trễ
+admission = AdmissionControl()
+loop_lag_monitor = EventLoopLagMonitor()
+
+# Chế độ stream NDJSON: mỗi dòng một object JSON, gom STREAM_CHUNK_ROWS dòng mỗi lần ghi
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_ROWS = 100
+
+# Số bộ câu trả lời tối đa trong một request /discover/batch, /professional/batch
+MAX_BATCH_SIZE = int(os.environ.get('CAELIO_MAX_BATCH_SIZE', '1000'))
+
 # === PYDANTIC MODELS ===
 
 class PersonalityAnswers(BaseModel):
@@ -139,6 +170,48 @@ class RecommendationResult(BaseModel):
     total_matches: int
     match_distribution: Dict[str, int]
 
+class DiscoveryBatchRequest(BaseModel):
+    """Model cho nhiều bộ câu trả lời khám phá trong một request"""
+    answer_sets: List[PersonalityAnswers]
+
+class ProfessionalBatchRequest(BaseModel):
+    """Model cho nhiều bộ câu trả lời chuyên ngành trong một request"""
+    answer_sets: List[ProfessionalAnswers]
+
+class BatchRecommendationItem(BaseModel):
+    """Kết quả của một bộ câu trả lời trong batch (lỗi validate nằm ở error)"""
+    index: int
+    result: Optional[RecommendationResult] = None
+    error: Optional[str] = None
+
+class BatchRecommendationResponse(BaseModel):
+    """Model cho response gợi ý theo batch"""
+    results: List[BatchRecommendationItem]
+    total: int
+    distinct_profiles: int
+
+class SessionAnswers(BaseModel):
+    """Model cho một hoặc nhiều câu trả lời gửi vào phiên (câu đã trả lời thì được sửa)"""
+    Q1: Optional[str] = None
+    Q2: Optional[str] = None
+    Q3: Optional[str] = None
+    Q4: Optional[str] = None
+    Q5: Optional[str] = None
+    Q6: Optional[str] = None
+    Q7: Optional[str] = None
+    Q8: Optional[str] = None
+
+class QuizSessionState(BaseModel):
+    """Model cho trạng thái phiên làm bài kèm profile tạm thời"""
+    session_id: str
+    answers: Dict[str, str]
+    answered: int
+    total_questions: int
+    next_question: Optional[str]
+    is_complete: bool
+    profile: Optional[PersonalityProfile] = None
+    expires_in: int
+
 class QuestionData(BaseModel):
     """Model cho câu hỏi"""
     question: str
@@ -195,25 +268,20 @@ class BookListResponse(BaseModel):
     total_pages: int
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None
 
 # === HELPER FUNCTIONS ===
 
-def safe_string_value(value, default=''):
-    """Safely convert value to string, handling NaN"""
-    if pd.isna(value):
-        return default
-    return str(value) if value is not None else default
-
-def create_book_recommendation(book) -> BookRecommendation:
-    """Create BookRecommendation object with safe string handling"""
+def create_book_recommendation(book, personality_match_score: float = 0.0) -> BookRecommendation:
+    """Create BookRecommendation from a catalog BookRecord (giá trị thiếu đã xử lý khi load)"""
     return BookRecommendation(
-        product_id=safe_string_value(book.get('product_id', '')),
-        title=safe_string_value(book.get('title', '')),
-        authors=safe_string_value(book.get('authors', '')),
-        category=safe_string_value(book.get('category', '')),
-        summary=safe_string_value(book.get('summary', '')),
-        personality_match_score=float(book.get('personality_match_score', 0.0)),
-        cover_link=safe_string_value(book.get('cover_link', ''))
+        product_id=book.product_id,
+        title=book.title,
+        authors=book.authors,
+        category=book.category,
+        summary=book.summary,
+        personality_match_score=personality_match_score,
+        cover_link=book.cover_link
     )
 
 def get_field_description(field: str) -> str:
@@ -333,193 +401,265 @@ def map_professional_to_personality_group(field: str, motivation: str, style: st
     # Default fallback
     return 'Tri thức'
 
-def get_personality_keywords_for_matching(primary_group: str, is_synthesizer: bool) -> List[str]:
-    """Lấy keywords để match sách theo personality group"""
-    base_keywords = {
-        'Kết nối': [
-            # Tâm lý - cảm xúc
-            'tâm lý', 'cảm xúc', 'tình yêu', 'gia đình', 'mối quan hệ', 'kết nối', 'giao tiếp',
-            'đồng cảm', 'chia sẻ', 'yêu thương', 'chăm sóc', 'hỗ trợ', 'giúp đỡ',
-            # Văn học cảm xúc
-            'tiểu thuyết', 'tản văn', 'hồi ký', 'nhật ký', 'thư từ', 'truyện ngắn',
-            'văn học', 'tình cảm', 'lãng mạn', 'gia đình', 'tuổi thơ', 'kỷ niệm',
-            # Phát triển bản thân - mối quan hệ
-            'phát triển bản thân', 'kỹ năng mềm', 'lãnh đạo', 'teamwork', 'hợp tác',
-            'xây dựng', 'nuôi dưỡng', 'giáo dục', 'con trẻ', 'parenting'
-        ],
-        'Tự do': [
-            # Du lịch - khám phá
-            'du lịch', 'khám phá', 'phiêu lưu', 'xê dịch', 'văn hóa', 'thế giới',
-            'tự do', 'độc lập', 'cá nhân', 'bản sắc', 'cá tính', 'phong cách',
-            # Nghệ thuật - sáng tạo  
-            'nghệ thuật', 'sáng tạo', 'thiết kế', 'hội họa', 'nhiếp ảnh', 'âm nhạc',
-            'thời trang', 'làm đẹp', 'phong cách sống', 'lifestyle', 'trang trí',
-            # Tư duy độc lập
-            'tư duy', 'suy nghĩ', 'quan điểm', 'góc nhìn', 'phản biện', 'độc đáo',
-            'khác biệt', 'đổi mới', 'sáng kiến', 'breakthrough', 'innovation'
-        ],
-        'Tri thức': [
-            # Khoa học - nghiên cứu
-            'khoa học', 'nghiên cứu', 'lý thuyết', 'phương pháp', 'phân tích', 'logic',
-            'toán học', 'vật lý', 'hóa học', 'sinh học', 'địa lý', 'thiên văn',
-            'công nghệ', 'kỹ thuật', 'máy tính', 'lập trình', 'ai', 'robotics',
-            # Lịch sử - triết học
-            'lịch sử', 'triết học', 'tôn giáo', 'văn minh', 'nhân loại', 'xã hội',
-            'chính trị', 'kinh tế học', 'tâm lý học', 'xã hội học', 'nhân học',
-            # Học thuật
-            'giáo trình', 'học thuật', 'nghiên cứu', 'luận văn', 'bài báo', 'chuyên ngành',
-            'đại học', 'cao học', 'tiến sĩ', 'giáo sư', 'chuyên gia', 'expert'
-        ],
-        'Chinh phục': [
-            # Thành công - lãnh đạo
-            'thành công', 'chiến thắng', 'đạt được', 'mục tiêu', 'kết quả', 'hiệu quả',
-            'lãnh đạo', 'quản lý', 'điều hành', 'chỉ đạo', 'dẫn dắt', 'leadership',
-            'CEO', 'giám đốc', 'sếp', 'quản lý', 'teamlead', 'manager',
-            # Thách thức - cạnh tranh
-            'thách thức', 'cạnh tranh', 'đối đầu', 'vượt qua', 'chinh phục', 'đột phá',
-            'chiến lược', 'tactic', 'kế hoạch', 'planning', 'strategy', 'execution',
-            # Truyền cảm hứng
-            'truyền cảm hứng', 'động lực', 'motivation', 'inspiring', 'passionate',
-            'quyết tâm', 'ý chí', 'bền bỉ', 'kiên trì', 'vượt khó', 'overcome'
-        ],
-        'Kiến tạo': [
-            # Kinh doanh - khởi nghiệp
-            'kinh doanh', 'khởi nghiệp', 'startup', 'doanh nghiệp', 'công ty', 'business',
-            'marketing', 'bán hàng', 'sales', 'customer', 'khách hàng', 'thị trường',
-            'đầu tư', 'tài chính', 'ngân hàng', 'chứng khoán', 'real estate', 'bất động sản',
-            # Kỹ năng thực tế
-            'kỹ năng', 'thực hành', 'ứng dụng', 'practical', 'hands-on', 'tutorial',
-            'hướng dẫn', 'cẩm nang', 'manual', 'guide', 'how-to', 'step-by-step',
-            # Xây dựng - phát triển
-            'xây dựng', 'phát triển', 'tăng trưởng', 'growth', 'scale', 'expansion',
-            'hệ thống', 'quy trình', 'process', 'system', 'framework', 'methodology'
-        ]
-    }
-    
-    keywords = base_keywords.get(primary_group, [])
-    
-    # Nếu là synthesizer, thêm keywords liên ngành
-    if is_synthesizer:
-        synthesizer_keywords = [
-            'liên ngành', 'đa ngành', 'tổng hợp', 'kết hợp', 'tích hợp', 'interdisciplinary',
-            'multidisciplinary', 'cross-functional', 'holistic', 'comprehensive',
-            'tư duy hệ thống', 'systems thinking', 'big picture', 'toàn cảnh',
-            'liên kết', 'kết nối', 'integration', 'synthesis', 'convergence'
-        ]
-        keywords.extend(synthesizer_keywords)
-    
-    return keywords
-
-def create_book_list_item(book_row) -> BookListItem:
-    """Create BookListItem object with safe string handling (without content)"""
+def create_book_list_item(book) -> BookListItem:
+    """Create BookListItem from a catalog BookRecord (without content)"""
     return BookListItem(
-        product_id=safe_string_value(book_row.get('product_id', '')),
-        title=safe_string_value(book_row.get('title', '')),
-        authors=safe_string_value(book_row.get('authors', '')),
-        original_price=float(book_row.get('original_price', 0)) if pd.notna(book_row.get('original_price')) else None,
-        current_price=float(book_row.get('current_price', 0)) if pd.notna(book_row.get('current_price')) else None,
-        category=safe_string_value(book_row.get('category', '')),
-        n_review=int(book_row.get('n_review', 0)) if pd.notna(book_row.get('n_review')) else None,
-        avg_rating=float(book_row.get('avg_rating', 0)) if pd.notna(book_row.get('avg_rating')) else None,
-        pages=int(book_row.get('pages', 0)) if pd.notna(book_row.get('pages')) else None,
-        manufacturer=safe_string_value(book_row.get('manufacturer', '')),
-        cover_link=safe_string_value(book_row.get('cover_link', '')),
-        summary=safe_string_value(book_row.get('summary', ''))
+        product_id=book.product_id,
+        title=book.title,
+        authors=book.authors,
+        original_price=book.original_price,
+        current_price=book.current_price,
+        category=book.category,
+        n_review=book.n_review,
+        avg_rating=book.avg_rating,
+        pages=book.pages,
+        manufacturer=book.manufacturer,
+        cover_link=book.cover_link,
+        summary=book.summary
     )
 
-def load_comments_database():
-    """Load comments database with fallback options"""
-    comments_file = 'dataset/comments.csv'
-    if not os.path.exists(comments_file):
-        fallback_files = [
-            'comments.csv',
-            '../dataset/comments.csv',
-            'data/comment_eda.csv'
-        ]
-        
-        for file_path in fallback_files:
-            if os.path.exists(file_path):
-                comments_file = file_path
-                break
-        
-        if not os.path.exists(comments_file):
-            return pd.DataFrame()  # Return empty DataFrame if no comments file found
-    
-    return pd.read_csv(comments_file)
-
 def get_book_comments(product_id: str, limit: int = 5) -> List[Comment]:
-    """Get first 5 unique comments for a book"""
+    """Get first 5 unique comments for a book (tính sẵn theo product_id khi load catalog)"""
     try:
-        comments_df = load_comments_database()
-        
-        if comments_df.empty:
-            return []
-        
-        # Filter comments for this product_id
-        book_comments = comments_df[comments_df['product_id'].astype(str) == str(product_id)]
-        
-        # Remove duplicates by comment_id and take first 5
-        unique_comments = book_comments.drop_duplicates(subset=['comment_id']).head(limit)
-        
-        comments = []
-        for _, comment_row in unique_comments.iterrows():
-            comment = Comment(
-                comment_id=safe_string_value(comment_row.get('comment_id', '')),
-                title=safe_string_value(comment_row.get('title', '')),
-                customer_id=safe_string_value(comment_row.get('customer_id', '')),
-                rating=int(comment_row.get('rating', 0)) if pd.notna(comment_row.get('rating')) else 0,
-                content=safe_string_value(comment_row.get('content', '')),
-                thank_count=int(comment_row.get('thank_count', 0)) if pd.notna(comment_row.get('thank_count')) else 0
-            )
-            comments.append(comment)
-        
-        return comments
+        return [Comment(**comment) for comment in get_catalog().get_comments(product_id, limit)]
     except Exception as e:
         print(f"Error loading comments: {e}")
         return []
 
-def create_book_detail(book_row) -> BookDetail:
-    """Create BookDetail object with safe string handling (with full content and comments)"""
-    product_id = safe_string_value(book_row.get('product_id', ''))
-    
+def create_book_detail(book) -> BookDetail:
+    """Create BookDetail from a catalog BookRecord (with content preview and comments)"""
     return BookDetail(
-        product_id=product_id,
-        title=safe_string_value(book_row.get('title', '')),
-        authors=safe_string_value(book_row.get('authors', '')),
-        original_price=float(book_row.get('original_price', 0)) if pd.notna(book_row.get('original_price')) else None,
-        current_price=float(book_row.get('current_price', 0)) if pd.notna(book_row.get('current_price')) else None,
-        quantity=float(book_row.get('quantity', 0)) if pd.notna(book_row.get('quantity')) else None,
-        category=safe_string_value(book_row.get('category', '')),
-        n_review=int(book_row.get('n_review', 0)) if pd.notna(book_row.get('n_review')) else None,
-        avg_rating=float(book_row.get('avg_rating', 0)) if pd.notna(book_row.get('avg_rating')) else None,
-        pages=int(book_row.get('pages', 0)) if pd.notna(book_row.get('pages')) else None,
-        manufacturer=safe_string_value(book_row.get('manufacturer', '')),
-        cover_link=safe_string_value(book_row.get('cover_link', '')),
-        summary=safe_string_value(book_row.get('summary', '')),
-        content=' '.join(safe_string_value(book_row.get('content', '')).split()[:100]),
-        comments=get_book_comments(product_id)
+        product_id=book.product_id,
+        title=book.title,
+        authors=book.authors,
+        original_price=book.original_price,
+        current_price=book.current_price,
+        quantity=book.quantity,
+        category=book.category,
+        n_review=book.n_review,
+        avg_rating=book.avg_rating,
+        pages=book.pages,
+        manufacturer=book.manufacturer,
+        cover_link=book.cover_link,
+        summary=book.summary,
+        content=book.content_preview,
+        comments=get_book_comments(book.product_id)
     )
 
-def load_book_database():
-    """Load book database with fallback options"""
-    book_file = 'dataset/books_full_data.csv'
-    if not os.path.exists(book_file):
-        fallback_files = [
-            'books_full_data.csv',
-            '../dataset/books_full_data.csv',
-            'v2/labeled_books_v2.csv'
-        ]
-        
-        for file_path in fallback_files:
-            if os.path.exists(file_path):
-                book_file = file_path
-                break
-        
-        if not os.path.exists(book_file):
-            raise HTTPException(status_code=404, detail="Book database not found")
+def load_book_catalog():
+    """Lấy catalog sách dùng chung (chỉ parse CSV một lần)"""
+    try:
+        return get_catalog()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Book database not found")
+
+def encode_books_cursor(filters: Dict[str, Optional[str]], last_key, page: int) -> str:
+    """Mã hóa cursor /books: bộ lọc, key của sách cuối trang trước và số trang"""
+    payload = json.dumps({'f': filters, 'k': list(last_key), 'p': page}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_books_cursor(cursor: str):
+    """Giải mã cursor /books, trả về (filters, last_key, page); cursor hỏng thì báo 400"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        key, occurrence = payload['k']
+        if not isinstance(key, str) or not isinstance(occurrence, int):
+            raise ValueError("invalid key")
+        return dict(payload['f']), (key, occurrence), int(payload['p'])
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def render_ranked_books(catalog, ranked, top_n: int) -> bytes:
+    """Phần recommendations/total_matches/match_distribution của RecommendationResult (dạng JSON)"""
+    top_positions = ranked.positions[:top_n]
+    fragments = [
+        catalog.fragments.recommendation(position, score)
+        for position, score in zip(top_positions, ranked.scores[:top_n])
+    ]
+    match_distribution = category_distribution(catalog, top_positions)
     
-    return pd.read_csv(book_file)
+    return (
+        b'"recommendations":[' + b','.join(fragments) + b']'
+        + b',"total_matches":' + render_json(ranked.total_matches)
+        + b',"match_distribution":' + render_json(match_distribution)
+    )
+
+def render_result_body(profile_response: PersonalityProfile, ranked_books: bytes) -> bytes:
+    """JSON của RecommendationResult từ profile và phần sách đã render"""
+    return b'{"profile":' + render_json(jsonable_encoder(profile_response)) + b',' + ranked_books + b'}'
 
+def render_recommendation_result(catalog, ranked, top_n: int, profile_response: PersonalityProfile) -> Response:
+    """RecommendationResult ghép từ JSON dựng sẵn của từng sách (không validate lại top_n model)"""
+    body = render_result_body(profile_response, render_ranked_books(catalog, ranked, top_n))
+    return Response(content=body, media_type="application/json")
+
+def render_book_list(catalog, positions, **page_fields) -> Response:
+    """BookListResponse ghép từ JSON dựng sẵn của từng sách; page_fields theo thứ tự field của model"""
+    body = (
+        b'{"books":[' + b','.join(catalog.fragments.list_item(position) for position in positions) + b'],'
+        + render_json(page_fields)[1:]
+    )
+    return Response(content=body, media_type="application/json")
+
+def check_response_format(format: str) -> bool:
+    """True nếu client yêu cầu stream NDJSON (format=ndjson); format lạ thì 400"""
+    if format not in ('json', 'ndjson'):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    return format == 'ndjson'
+
+def stream_ndjson(header: Dict[str, Any], rows) -> StreamingResponse:
+    """NDJSON: dòng đầu là header, sau đó mỗi dòng một fragment lấy dần từ `rows`
+
+    rows là iterator nên fragment chỉ được render khi tới lượt ghi; bộ nhớ và
+    thời gian tới byte đầu tiên không tăng theo số dòng.
+    """
+    def chunks():
+        yield render_json(header) + b'\n'
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= STREAM_CHUNK_ROWS:
+                yield b'\n'.join(buffer) + b'\n'
+                buffer = []
+        if buffer:
+            yield b'\n'.join(buffer) + b'\n'
+    
+    return StreamingResponse(chunks(), media_type=NDJSON_MEDIA_TYPE)
+
+def stream_recommendation_result(catalog, ranked, top_n: int, profile_response: PersonalityProfile) -> StreamingResponse:
+    """RecommendationResult dạng NDJSON: dòng đầu profile/total_matches/match_distribution, sau đó mỗi dòng một sách"""
+    top_positions = ranked.positions[:top_n]
+    header = {
+        'profile': jsonable_encoder(profile_response),
+        'total_matches': ranked.total_matches,
+        'match_distribution': category_distribution(catalog, top_positions)
+    }
+    rows = (
+        catalog.fragments.recommendation(position, score)
+        for position, score in zip(top_positions, ranked.scores[:top_n])
+    )
+    return stream_ndjson(header, rows)
+
+
+def build_profile_response(profile: Dict[str, Any]) -> PersonalityProfile:
+    """PersonalityProfile (kèm mô tả) từ dict profile"""
+    return PersonalityProfile(
+        primary_group=profile['primary_group'],
+        secondary_group=profile['secondary_group'],
+        primary_score=profile['primary_score'],
+        secondary_score=profile['secondary_score'],
+        synthesizer_score=profile['synthesizer_score'],
+        is_synthesizer=profile['is_synthesizer'],
+        profile_name=profile['profile_name'],
+        english_name=profile['english_name'],
+        all_scores=profile['all_scores'],
+        is_multi_motivated=profile['is_multi_motivated'],
+        description=get_personality_description(profile['primary_group'], profile['is_synthesizer'])
+    )
+
+def analyze_discovery_answers(answers_dict: Dict[str, str]) -> Dict[str, Any]:
+    """Validate câu trả lời khám phá (3 hoặc 8 câu) và tính profile; sai thì HTTPException 400"""
+    # Kiểm tra số lượng câu trả lời (phải là 3 hoặc 8)
+    num_answers = len(answers_dict)
+    if num_answers != 3 and num_answers != 8:
+        raise HTTPException(status_code=400, detail="Must provide either 3 answers (Q1-Q3) or 8 answers (Q1-Q8)")
+    
+    # Validate answers
+    for q_id, answer in answers_dict.items():
+        if q_id not in personality_system.discovery_questions:
+            raise HTTPException(status_code=400, detail=f"Invalid question ID: {q_id}")
+        
+        question_choices = personality_system.discovery_questions[q_id]['choices']
+        if answer not in question_choices:
+            raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for question {q_id}")
+    
+    # Phân tích dựa trên số câu trả lời
+    if num_answers == 3:
+        # Phân tích sơ bộ từ 3 câu đầu (WHY questions), tra bảng tính sẵn
+        return personality_system.calculate_partial_profile(answers_dict)
+    # Phân tích đầy đủ từ 8 câu: tra atlas nếu đã load
+    if profile_atlas is not None:
+        return profile_atlas.resolve(answers_dict)
+    return personality_system.calculate_discovery_profile(answers_dict)
+
+def analyze_professional_answers(professional_dict: Dict[str, str]):
+    """Validate 4 câu trả lời chuyên ngành và map sang profile tính cách; trả về (profile, field)"""
+    # Validate professional answers
+    for q_id, answer in professional_dict.items():
+        if q_id not in personality_system.professional_questions:
+            raise HTTPException(status_code=400, detail=f"Invalid professional question ID: {q_id}")
+        
+        question_choices = personality_system.professional_questions[q_id]['choices']
+        if answer not in question_choices:
+            raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for professional question {q_id}")
+    
+    # Phân tích thông tin chuyên ngành
+    field = personality_system.professional_questions['Q1']['choices'][professional_dict['Q1']]['field']
+    motivation = personality_system.professional_questions['Q2']['choices'][professional_dict['Q2']]['motivation'] 
+    style = personality_system.professional_questions['Q3']['choices'][professional_dict['Q3']]['style']
+    presentation = personality_system.professional_questions['Q4']['choices'][professional_dict['Q4']]['presentation']
+    
+    # Kiểm tra Synthesizer tiềm năng
+    synthesizer_indicators = 0
+    if professional_dict['Q3'] == 'B':  # Tự mình tìm liên kết
+        synthesizer_indicators += 1
+    if professional_dict['Q4'] == 'C':  # Kết nối đa ngành
+        synthesizer_indicators += 1
+    
+    is_synthesizer = synthesizer_indicators >= 2
+    
+    # Map professional answers sang personality group hợp lý
+    primary_group = map_professional_to_personality_group(field, motivation, style, presentation)
+    
+    # Tạo personality profile từ professional context
+    profile = {
+        'primary_group': primary_group,
+        'secondary_group': None,
+        'primary_score': 100,  # Professional context gives strong indication
+        'secondary_score': 0,
+        'synthesizer_score': synthesizer_indicators * 50,
+        'is_synthesizer': is_synthesizer,
+        'profile_name': f"{primary_group}{'–Synthesizer' if is_synthesizer else ''}",
+        'english_name': f"Professional {primary_group}{'–Synthesizer' if is_synthesizer else ''}",
+        'all_scores': {primary_group: 100, 'Synthesizer': synthesizer_indicators * 50},
+        'is_multi_motivated': False
+    }
+    return profile, field
+
+def render_batch_results(catalog, answer_sets: List[Dict[str, str]], analyze, top_n: int) -> Response:
+    """Kết quả cho từng bộ câu trả lời; bộ trùng nhau và bảng xếp hạng trùng nhau chỉ tính/render một lần
+
+    analyze(answers) trả về (profile, field). Lỗi validate của một bộ được ghi vào
+    `error` của bộ đó thay vì làm hỏng cả batch.
+    """
+    results_by_answers = {}
+    ranked_books_by_key = {}
+    items = []
+    
+    for index, answers_dict in enumerate(answer_sets):
+        answers_key = tuple(sorted(answers_dict.items()))
+        result = results_by_answers.get(answers_key)
+        if result is None:
+            try:
+                profile, field = analyze(answers_dict)
+                ranking_key = (profile['primary_group'], bool(profile['is_synthesizer']), field)
+                if ranking_key not in ranked_books_by_key:
+                    ranked = catalog.engine.get_ranking(*ranking_key, top_n=top_n)
+                    ranked_books_by_key[ranking_key] = render_ranked_books(catalog, ranked, top_n)
+                body = render_result_body(build_profile_response(profile), ranked_books_by_key[ranking_key])
+                result = b'"result":' + body + b',"error":null'
+            except HTTPException as e:
+                result = b'"result":null,"error":' + render_json(e.detail)
+            results_by_answers[answers_key] = result
+        items.append(b'{"index":' + render_json(index) + b',' + result + b'}')
+    
+    body = (
+        b'{"results":[' + b','.join(items) + b']'
+        + b',"total":' + render_json(len(items))
+        + b',"distinct_profiles":' + render_json(len(ranked_books_by_key)) + b'}'
+    )
+    return Response(content=body, media_type="application/json")
 
 def ensure_complete_discovery_answers(answers: Dict[str, str]) -> Dict[str, str]:
     """Ensure answers dict contains Q1..Q8 by filling missing with a safe default (first available choice).
@@ -589,6 +729,41 @@ def get_personality_description(primary_group: str, is_synthesizer: bool) -> Dic
 
 # === API ENDPOINTS ===
 
+async def cpu_slot():
+    """Giữ một chỗ trong pool cho endpoint nặng CPU; pool và hàng chờ đầy thì trả 503"""
+    if not admission.try_acquire():
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        admission.release()
+
+@app.on_event("startup")
+async def load_catalog_on_startup():
+    """Load catalog sách ngay khi khởi động để request đầu tiên không phải chờ"""
+    global catalog_watcher, profile_atlas
+    admission.limiter = configure_worker_threads(admission.workers)
+    loop_lag_monitor.start()
+    profile_atlas = ensure_atlas(personality_system)
+    if profile_atlas is None:
+        print("⚠️ Profile atlas unavailable, profiles will be computed per request")
+    try:
+        catalog = get_catalog()
+        print(f"📚 Loaded {len(catalog)} books in {catalog.load_seconds:.2f}s")
+    except FileNotFoundError:
+        print("⚠️ Book database not found, book endpoints will return 404")
+
+    if os.environ.get('CAELIO_CATALOG_WATCH', '1') != '0':
+        catalog_watcher = CatalogWatcher()
+        catalog_watcher.start()
+
+@app.on_event("shutdown")
+async def stop_catalog_watcher():
+    """Dừng thread theo dõi dữ liệu khi tắt server"""
+    loop_lag_monitor.stop()
+    if catalog_watcher is not None:
+        catalog_watcher.stop()
+
 @app.get("/")
 async def root():
     """Endpoint gốc"""
@@ -691,57 +866,22 @@ async def get_question(question_id: str, question_type: str = "discovery"):
         choices=choices_formatted
     )
 
-@app.post("/analyze", response_model=PersonalityProfile)
-async def analyze_personality(answers: PersonalityAnswers):
+@app.post("/analyze", response_model=PersonalityProfile, dependencies=[Depends(cpu_slot)])
+def analyze_personality(answers: PersonalityAnswers):
     """Phân tích tính cách từ câu trả lời hành trình khám phá (3 hoặc 8 câu)"""
     try:
         # Chuyển đổi sang format dictionary và loại bỏ None values
         answers_dict = {k: v for k, v in answers.dict().items() if v is not None}
         
-        # Kiểm tra số lượng câu trả lời (phải là 3 hoặc 8)
-        num_answers = len(answers_dict)
-        if num_answers != 3 and num_answers != 8:
-            raise HTTPException(status_code=400, detail="Must provide either 3 answers (Q1-Q3) or 8 answers (Q1-Q8)")
-        
-        # Validate answers
-        for q_id, answer in answers_dict.items():
-            if q_id not in personality_system.discovery_questions:
-                raise HTTPException(status_code=400, detail=f"Invalid question ID: {q_id}")
-            
-            question_choices = personality_system.discovery_questions[q_id]['choices']
-            if answer not in question_choices:
-                raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for question {q_id}")
-        
-        # Phân tích dựa trên số câu trả lời
-        if num_answers == 3:
-            # Phân tích sơ bộ từ 3 câu đầu (WHY questions)
-            profile = personality_system.calculate_partial_profile(answers_dict)
-        else:
-            # Phân tích đầy đủ từ 8 câu
-            profile = personality_system.calculate_discovery_profile(answers_dict)
-        
-        # Lấy mô tả
-        description = get_personality_description(profile['primary_group'], profile['is_synthesizer'])
-        
-        return PersonalityProfile(
-            primary_group=profile['primary_group'],
-            secondary_group=profile['secondary_group'],
-            primary_score=profile['primary_score'],
-            secondary_score=profile['secondary_score'],
-            synthesizer_score=profile['synthesizer_score'],
-            is_synthesizer=profile['is_synthesizer'],
-            profile_name=profile['profile_name'],
-            english_name=profile['english_name'],
-            all_scores=profile['all_scores'],
-            is_multi_motivated=profile['is_multi_motivated'],
-            description=description
-        )
+        # Validate và phân tích (3 câu: sơ bộ từ WHY questions, 8 câu: đầy đủ), kèm mô tả
+        profile = analyze_discovery_answers(answers_dict)
+        return build_profile_response(profile)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing personality: {str(e)}")
 
-@app.post("/analyze-professional", response_model=Dict[str, Any])
-async def analyze_professional_personality(answers: ProfessionalAnswers):
+@app.post("/analyze-professional", response_model=Dict[str, Any], dependencies=[Depends(cpu_slot)])
+def analyze_professional_personality(answers: ProfessionalAnswers):
     """Phân tích chuyên ngành từ 4 câu hỏi chuyên ngành (Q1-Q4)"""
     try:
         # Chuyển đổi sang format dictionary
@@ -783,106 +923,29 @@ async def analyze_professional_personality(answers: ProfessionalAnswers):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing professional profile: {str(e)}")
 
-@app.post("/recommend", response_model=RecommendationResult)
-async def get_book_recommendations(answers: PersonalityAnswers, top_n: int = 20):
-    """Lấy gợi ý sách dựa trên personality profile"""
+@app.post("/recommend", response_model=RecommendationResult, dependencies=[Depends(cpu_slot)])
+def get_book_recommendations(answers: PersonalityAnswers, top_n: int = 20, format: str = "json"):
+    """Lấy gợi ý sách dựa trên personality profile (format=ndjson: stream từng sách)"""
+    stream = check_response_format(format)
     try:
         # Phân tích tính cách
         answers_dict = answers.dict()
         profile = personality_system.calculate_discovery_profile(answers_dict)
         
-        # Thêm description
-        description = get_personality_description(profile['primary_group'], profile['is_synthesizer'])
+        # Lấy bảng xếp hạng đã tính sẵn cho profile này từ catalog dùng chung
+        catalog = load_book_catalog()
+        ranked = catalog.engine.get_ranking(profile['primary_group'], profile['is_synthesizer'], top_n=top_n)
         
-        # Load dữ liệu sách
-        book_df = load_book_database()
-        
-        # Lấy gợi ý sách với improved matching (same as /discover)
-        personality_keywords = get_personality_keywords_for_matching(profile['primary_group'], profile['is_synthesizer'])
-        
-        # Score và filter sách
-        scored_books = []
-        for _, book in book_df.iterrows():
-            cat = safe_string_value(book.get('category', '')).lower()
-            title = safe_string_value(book.get('title', '')).lower() 
-            summary = safe_string_value(book.get('summary', '')).lower()
-            content = safe_string_value(book.get('content', '')).lower()
-            
-            # Calculate match score
-            match_score = 0.0
-            total_keywords = len(personality_keywords)
-            
-            for keyword in personality_keywords:
-                keyword_score = 0
-                if keyword in cat:
-                    keyword_score += 3
-                if keyword in title:
-                    keyword_score += 2
-                if keyword in summary:
-                    keyword_score += 1
-                if keyword in content:
-                    keyword_score += 0.5
-                
-                if keyword_score > 0:
-                    match_score += keyword_score / total_keywords
-            
-            # Sales and quality bonuses
-            quantity = float(book.get('quantity', 0)) if pd.notna(book.get('quantity')) else 0
-            sales_boost = min(quantity / 10000, 1.0) * 0.2
-            
-            avg_rating = float(book.get('avg_rating', 0)) if pd.notna(book.get('avg_rating')) else 0
-            n_review = int(book.get('n_review', 0)) if pd.notna(book.get('n_review')) else 0
-            
-            rating_boost = (avg_rating / 5.0) * 0.1 if avg_rating > 0 else 0
-            review_boost = min(n_review / 1000, 1.0) * 0.1 if n_review > 0 else 0
-            
-            final_score = match_score + sales_boost + rating_boost + review_boost
-            
-            if final_score > 0.05:
-                scored_books.append((book, final_score))
-        
-        # Sort by score and sales
-        scored_books.sort(key=lambda x: (x[1], float(x[0].get('quantity', 0)) if pd.notna(x[0].get('quantity')) else 0), reverse=True)
-        
-        # Create recommendations
-        recommendations = []
-        match_distribution = {}
-        
-        for book, score in scored_books[:top_n]:
-            book_rec = create_book_recommendation(book)
-            book_rec.personality_match_score = score
-            recommendations.append(book_rec)
-            
-            category = safe_string_value(book.get('category', 'Unknown'))
-            match_distribution[category] = match_distribution.get(category, 0) + 1
-        
-        # Tạo profile response
-        profile_response = PersonalityProfile(
-            primary_group=profile['primary_group'],
-            secondary_group=profile['secondary_group'],
-            primary_score=profile['primary_score'],
-            secondary_score=profile['secondary_score'],
-            synthesizer_score=profile['synthesizer_score'],
-            is_synthesizer=profile['is_synthesizer'],
-            profile_name=profile['profile_name'],
-            english_name=profile['english_name'],
-            all_scores=profile['all_scores'],
-            is_multi_motivated=profile['is_multi_motivated'],
-            description=description
-        )
-        
-        return RecommendationResult(
-            profile=profile_response,
-            recommendations=recommendations,
-            total_matches=len(scored_books),
-            match_distribution=match_distribution
-        )
+        # Tạo profile response (kèm description)
+        if stream:
+            return stream_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
+        return render_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting recommendations: {str(e)}")
 
-@app.post("/recommend-professional", response_model=Dict[str, Any])
-async def get_professional_book_recommendations(answers: ProfessionalAnswers, top_n: int = 20):
+@app.post("/recommend-professional", response_model=Dict[str, Any], dependencies=[Depends(cpu_slot)])
+def get_professional_book_recommendations(answers: ProfessionalAnswers, top_n: int = 20):
     """Lấy gợi ý sách dựa trên thông tin chuyên ngành (4 câu hỏi)"""
     try:
         # Phân tích thông tin chuyên ngành
@@ -929,279 +992,208 @@ async def get_professional_book_recommendations(answers: ProfessionalAnswers, to
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting professional recommendations: {str(e)}")
 
-@app.post("/discover", response_model=RecommendationResult)
-async def discover_and_recommend(answers: PersonalityAnswers, top_n: int = 20):
-    """API tổng hợp: Phân tích tính cách + Gợi ý sách cho hành trình khám phá"""
+@app.post("/discover", response_model=RecommendationResult, dependencies=[Depends(cpu_slot)])
+def discover_and_recommend(answers: PersonalityAnswers, top_n: int = 20, format: str = "json"):
+    """API tổng hợp: Phân tích tính cách + Gợi ý sách cho hành trình khám phá (format=ndjson: stream từng sách)"""
+    stream = check_response_format(format)
     try:
         # Chuyển đổi sang format dictionary và loại bỏ None values
         answers_dict = {k: v for k, v in answers.dict().items() if v is not None}
         
-        # Kiểm tra số lượng câu trả lời (phải là 3 hoặc 8)
-        num_answers = len(answers_dict)
-        if num_answers != 3 and num_answers != 8:
-            raise HTTPException(status_code=400, detail="Must provide either 3 answers (Q1-Q3) or 8 answers (Q1-Q8)")
-        
-        # Validate answers
-        for q_id, answer in answers_dict.items():
-            if q_id not in personality_system.discovery_questions:
-                raise HTTPException(status_code=400, detail=f"Invalid question ID: {q_id}")
-            
-            question_choices = personality_system.discovery_questions[q_id]['choices']
-            if answer not in question_choices:
-                raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for question {q_id}")
-        
-        # Phân tích dựa trên số câu trả lời
-        if num_answers == 3:
-            # Phân tích sơ bộ từ 3 câu đầu (WHY questions)
-            profile = personality_system.calculate_partial_profile(answers_dict)
-        else:
-            # Phân tích đầy đủ từ 8 câu
-            profile = personality_system.calculate_discovery_profile(answers_dict)
-        
-        # Lấy mô tả
-        description = get_personality_description(profile['primary_group'], profile['is_synthesizer'])
+        # Validate và phân tích (3 câu: sơ bộ từ WHY questions, 8 câu: đầy đủ)
+        profile = analyze_discovery_answers(answers_dict)
         
-        # Load dữ liệu sách
-        book_df = load_book_database()
+        # Lấy bảng xếp hạng đã tính sẵn cho profile này từ catalog dùng chung
+        catalog = load_book_catalog()
+        ranked = catalog.engine.get_ranking(profile['primary_group'], profile['is_synthesizer'], top_n=top_n)
         
-        # Lấy gợi ý sách với improved matching
-        # Get keywords for personality matching
-        personality_keywords = get_personality_keywords_for_matching(profile['primary_group'], profile['is_synthesizer'])
-        
-        # Score và filter sách
-        scored_books = []
-        for _, book in book_df.iterrows():
-            cat = safe_string_value(book.get('category', '')).lower()
-            title = safe_string_value(book.get('title', '')).lower() 
-            summary = safe_string_value(book.get('summary', '')).lower()
-            content = safe_string_value(book.get('content', '')).lower()
-            
-            # Calculate match score based on keywords
-            match_score = 0.0
-            total_keywords = len(personality_keywords)
-            
-            for keyword in personality_keywords:
-                keyword_score = 0
-                if keyword in cat:
-                    keyword_score += 3  # Category match is most important
-                if keyword in title:
-                    keyword_score += 2  # Title match is very important
-                if keyword in summary:
-                    keyword_score += 1  # Summary match is important
-                if keyword in content:
-                    keyword_score += 0.5  # Content match is less important
-                
-                if keyword_score > 0:
-                    match_score += keyword_score / total_keywords
-            
-            # Bonus for sales volume (quantity)
-            quantity = float(book.get('quantity', 0)) if pd.notna(book.get('quantity')) else 0
-            sales_boost = min(quantity / 10000, 1.0) * 0.2  # Max 20% boost for high sales
-            
-            # Bonus for rating and reviews
-            avg_rating = float(book.get('avg_rating', 0)) if pd.notna(book.get('avg_rating')) else 0
-            n_review = int(book.get('n_review', 0)) if pd.notna(book.get('n_review')) else 0
-            
-            rating_boost = (avg_rating / 5.0) * 0.1 if avg_rating > 0 else 0  # Max 10% boost for high rating
-            review_boost = min(n_review / 1000, 1.0) * 0.1 if n_review > 0 else 0  # Max 10% boost for many reviews
-            
-            final_score = match_score + sales_boost + rating_boost + review_boost
-            
-            if final_score > 0.05:  # Threshold for inclusion
-                scored_books.append((book, final_score))
-        
-        # Sort by score (descending) and sales volume (descending)
-        scored_books.sort(key=lambda x: (x[1], float(x[0].get('quantity', 0)) if pd.notna(x[0].get('quantity')) else 0), reverse=True)
-        
-        # Take top_n recommendations
-        recommendations = []
-        match_distribution = {}
-        
-        for book, score in scored_books[:top_n]:
-            book_rec = create_book_recommendation(book)
-            book_rec.personality_match_score = score
-            recommendations.append(book_rec)
-            
-            # Track distribution
-            category = safe_string_value(book.get('category', 'Unknown'))
-            match_distribution[category] = match_distribution.get(category, 0) + 1
-        
-        # Tạo profile response
-        profile_response = PersonalityProfile(
-            primary_group=profile['primary_group'],
-            secondary_group=profile['secondary_group'],
-            primary_score=profile['primary_score'],
-            secondary_score=profile['secondary_score'],
-            synthesizer_score=profile['synthesizer_score'],
-            is_synthesizer=profile['is_synthesizer'],
-            profile_name=profile['profile_name'],
-            english_name=profile['english_name'],
-            all_scores=profile['all_scores'],
-            is_multi_motivated=profile['is_multi_motivated'],
-            description=description
-        )
-        
-        return RecommendationResult(
-            profile=profile_response,
-            recommendations=recommendations,
-            total_matches=len(scored_books),
-            match_distribution=match_distribution
-        )
+        if stream:
+            return stream_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
+        return render_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in discover and recommend: {str(e)}")
 
-@app.post("/professional", response_model=RecommendationResult)
-async def professional_and_recommend(answers: ProfessionalAnswers, top_n: int = 20):
+@app.post("/professional", response_model=RecommendationResult, dependencies=[Depends(cpu_slot)])
+def professional_and_recommend(answers: ProfessionalAnswers, top_n: int = 20):
     """API tổng hợp chuyên ngành: Phân tích + Gợi ý sách từ 4 câu hỏi chuyên ngành"""
     try:
         # Phân tích thông tin chuyên ngành
         professional_dict = answers.dict()
         
-        # Validate professional answers
-        for q_id, answer in professional_dict.items():
-            if q_id not in personality_system.professional_questions:
-                raise HTTPException(status_code=400, detail=f"Invalid professional question ID: {q_id}")
-            
-            question_choices = personality_system.professional_questions[q_id]['choices']
-            if answer not in question_choices:
-                raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for professional question {q_id}")
-        
-        # Phân tích thông tin chuyên ngành
-        field = personality_system.professional_questions['Q1']['choices'][professional_dict['Q1']]['field']
-        motivation = personality_system.professional_questions['Q2']['choices'][professional_dict['Q2']]['motivation'] 
-        style = personality_system.professional_questions['Q3']['choices'][professional_dict['Q3']]['style']
-        presentation = personality_system.professional_questions['Q4']['choices'][professional_dict['Q4']]['presentation']
-        
-        # Kiểm tra Synthesizer tiềm năng
-        synthesizer_indicators = 0
-        if professional_dict['Q3'] == 'B':  # Tự mình tìm liên kết
-            synthesizer_indicators += 1
-        if professional_dict['Q4'] == 'C':  # Kết nối đa ngành
-            synthesizer_indicators += 1
-        
-        is_synthesizer = synthesizer_indicators >= 2
-        
-        # Map professional answers sang personality group hợp lý
-        primary_group = map_professional_to_personality_group(field, motivation, style, presentation)
-        
-        # Tạo personality profile từ professional context
-        profile = {
-            'primary_group': primary_group,
-            'secondary_group': None,
-            'primary_score': 100,  # Professional context gives strong indication
-            'secondary_score': 0,
-            'synthesizer_score': synthesizer_indicators * 50,
-            'is_synthesizer': is_synthesizer,
-            'profile_name': f"{primary_group}{'–Synthesizer' if is_synthesizer else ''}",
-            'english_name': f"Professional {primary_group}{'–Synthesizer' if is_synthesizer else ''}",
-            'all_scores': {primary_group: 100, 'Synthesizer': synthesizer_indicators * 50},
-            'is_multi_motivated': False
-        }
+        # Validate, phân tích và map sang personality group
+        profile, field = analyze_professional_answers(professional_dict)
 
-        # Load book database
-        book_df = load_book_database()
-
-        # Lấy keywords cho matching dựa trên personality + field
-        personality_keywords = get_personality_keywords_for_matching(primary_group, is_synthesizer)
-        field_keywords = {
-            'business': ['kinh doanh', 'marketing', 'bán hàng', 'quản trị', 'tài chính', 'kế toán', 'chứng khoán', 'đầu tư', 'khởi nghiệp'],
-            'humanities': ['văn học', 'lịch sử', 'triết học', 'xã hội', 'nhân văn', 'tôn giáo', 'văn hóa'],
-            'science': ['khoa học', 'toán học', 'vật lý', 'hóa học', 'sinh học', 'địa lý', 'kỹ thuật'],
-            'technology': ['công nghệ', 'tin học', 'lập trình', 'máy tính', 'internet', 'ai', 'robot'],
-            'medical': ['y học', 'sức khỏe', 'dược', 'y khoa', 'chăm sóc', 'dinh dưỡng'],
-            'education': ['giáo dục', 'sư phạm', 'dạy học', 'đào tạo', 'trẻ em'],
-            'arts': ['nghệ thuật', 'hội họa', 'thiết kế', 'kiến trúc', 'âm nhạc', 'múa', 'thời trang'],
-            'agriculture': ['nông nghiệp', 'lâm nghiệp', 'thủy sản', 'trồng trọt', 'chăn nuôi']
-        }
-        
-        # Kết hợp keywords từ personality và field
-        all_keywords = personality_keywords + field_keywords.get(field, [])
-        
-        # Score và filter sách
-        scored_books = []
-        for _, book in book_df.iterrows():
-            cat = safe_string_value(book.get('category', '')).lower()
-            title = safe_string_value(book.get('title', '')).lower() 
-            summary = safe_string_value(book.get('summary', '')).lower()
-            content = safe_string_value(book.get('content', '')).lower()
-            
-            # Calculate match score
-            match_score = 0.0
-            total_keywords = len(all_keywords)
-            
-            for keyword in all_keywords:
-                keyword_score = 0
-                if keyword in cat:
-                    keyword_score += 3  # Category match is most important
-                if keyword in title:
-                    keyword_score += 2  # Title match is very important
-                if keyword in summary:
-                    keyword_score += 1  # Summary match is important
-                if keyword in content:
-                    keyword_score += 0.5  # Content match is less important
-                
-                if keyword_score > 0:
-                    match_score += keyword_score / total_keywords
-            
-            # Bonus for sales volume (quantity)
-            quantity = float(book.get('quantity', 0)) if pd.notna(book.get('quantity')) else 0
-            sales_boost = min(quantity / 10000, 1.0) * 0.2  # Max 20% boost for high sales
-            
-            final_score = match_score + sales_boost
-            
-            if final_score > 0.05:  # Threshold for inclusion
-                scored_books.append((book, final_score))
-        
-        # Sort by score (descending) and sales volume (descending)
-        scored_books.sort(key=lambda x: (x[1], float(x[0].get('quantity', 0)) if pd.notna(x[0].get('quantity')) else 0), reverse=True)
+        # Bảng xếp hạng theo personality + field (keywords chuyên ngành, không cộng bonus rating/review)
+        catalog = load_book_catalog()
+        ranked = catalog.engine.get_ranking(profile['primary_group'], profile['is_synthesizer'], field, top_n=top_n)
+
+        return render_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
         
-        # Take top_n recommendations
-        recommendations = []
-        match_distribution = {}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in professional and recommend: {str(e)}")
+
+def check_batch_size(answer_sets) -> None:
+    if len(answer_sets) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large: at most {MAX_BATCH_SIZE} answer sets per request")
+
+@app.post("/discover/batch", response_model=BatchRecommendationResponse, dependencies=[Depends(cpu_slot)])
+def discover_and_recommend_batch(request: DiscoveryBatchRequest, top_n: int = 20):
+    """/discover cho nhiều bộ câu trả lời: profile trùng nhau chỉ xếp hạng và render một lần"""
+    check_batch_size(request.answer_sets)
+    try:
+        answer_sets = [
+            {k: v for k, v in answers.dict().items() if v is not None}
+            for answers in request.answer_sets
+        ]
+        catalog = load_book_catalog()
+        return render_batch_results(catalog, answer_sets, lambda a: (analyze_discovery_answers(a), None), top_n)
         
-        for book, score in scored_books[:top_n]:
-            book_rec = create_book_recommendation(book)
-            book_rec.personality_match_score = score
-            recommendations.append(book_rec)
-            
-            # Track distribution
-            category = safe_string_value(book.get('category', 'Unknown'))
-            match_distribution[category] = match_distribution.get(category, 0) + 1
-
-        # Tạo profile response
-        description = get_personality_description(primary_group, is_synthesizer)
-        profile_response = PersonalityProfile(
-            primary_group=profile['primary_group'],
-            secondary_group=profile['secondary_group'],
-            primary_score=profile['primary_score'],
-            secondary_score=profile['secondary_score'],
-            synthesizer_score=profile['synthesizer_score'],
-            is_synthesizer=profile['is_synthesizer'],
-            profile_name=profile['profile_name'],
-            english_name=profile['english_name'],
-            all_scores=profile['all_scores'],
-            is_multi_motivated=profile['is_multi_motivated'],
-            description=description
-        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in batch discover and recommend: {str(e)}")
 
-        return RecommendationResult(
-            profile=profile_response,
-            recommendations=recommendations,
-            total_matches=len(scored_books),
-            match_distribution=match_distribution
-        )
+@app.post("/professional/batch", response_model=BatchRecommendationResponse, dependencies=[Depends(cpu_slot)])
+def professional_and_recommend_batch(request: ProfessionalBatchRequest, top_n: int = 20):
+    """/professional cho nhiều bộ câu trả lời chuyên ngành"""
+    check_batch_size(request.answer_sets)
+    try:
+        answer_sets = [answers.dict() for answers in request.answer_sets]
+        catalog = load_book_catalog()
+        return render_batch_results(catalog, answer_sets, analyze_professional_answers, top_n)
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error in professional and recommend: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error in batch professional and recommend: {str(e)}")
+
+def session_state(session) -> QuizSessionState:
+    """Trạng thái phiên kèm profile tạm thời (None khi chưa trả lời câu nào)"""
+    profile = session.profile()
+    return QuizSessionState(
+        session_id=session.session_id,
+        answers=dict(session.answers),
+        answered=len(session.answers),
+        total_questions=len(personality_system.discovery_questions),
+        next_question=session.next_question,
+        is_complete=session.is_complete,
+        profile=build_profile_response(profile) if profile is not None else None,
+        expires_in=int(session_store.ttl)
+    )
+
+def prefetch_final_answer(session, question: str, base_answers: Dict[str, str], profiles: Dict[str, Dict[str, Any]],
+                          top_n: int = PREFETCH_TOP_N):
+    """Tính trước RecommendationResult cho từng lựa chọn của câu cuối (chạy sau khi trả response)
+
+    Các lựa chọn cùng (nhóm, synthesizer) dùng chung phần sách đã render, chỉ
+    khác phần profile.
+    """
+    start = time.perf_counter()
+    try:
+        catalog = get_catalog()
+    except FileNotFoundError:
+        return
+    ranked_books = {}
+    bodies = {}
+    for choice, profile in profiles.items():
+        key = (profile['primary_group'], profile['is_synthesizer'])
+        if key not in ranked_books:
+            ranked = catalog.engine.get_ranking(*key, top_n=top_n)
+            ranked_books[key] = render_ranked_books(catalog, ranked, top_n)
+        bodies[choice] = render_result_body(build_profile_response(profile), ranked_books[key])
+    
+    prefetch = FinalAnswerPrefetch(question, base_answers, top_n, catalog, bodies, time.perf_counter() - start)
+    session.prefetch = prefetch
+    session_store.prefetch_stats.record_run(prefetch)
+
+async def prefetch_final_answer_in_slot(*args):
+    """Chạy prefetch_final_answer trong thread pool với chỗ đã giữ, trả chỗ khi xong"""
+    try:
+        await run_in_threadpool(prefetch_final_answer, *args)
+    finally:
+        admission.release()
+
+def get_session_or_404(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+@app.post("/sessions", response_model=QuizSessionState)
+async def create_quiz_session():
+    """Bắt đầu phiên làm bài khám phá, trả lời từng câu qua PATCH /sessions/{session_id}/answers"""
+    return session_state(session_store.create())
+
+@app.get("/sessions/{session_id}", response_model=QuizSessionState)
+async def get_quiz_session(session_id: str):
+    """Trạng thái hiện tại của phiên"""
+    return session_state(get_session_or_404(session_id))
 
-@app.get("/books", response_model=BookListResponse)
-async def get_books(
+@app.patch("/sessions/{session_id}/answers", response_model=QuizSessionState)
+async def answer_quiz_session(session_id: str, answers: SessionAnswers, background_tasks: BackgroundTasks):
+    """Ghi một hoặc nhiều câu trả lời; mỗi câu chỉ cập nhật bộ đếm điểm của câu đó
+
+    Trả về profile tạm thời sau khi cập nhật. Khi đủ 8 câu, profile giống hệt /analyze.
+    Khi còn đúng một câu, gợi ý cho mọi lựa chọn của câu đó được tính trước ở nền,
+    nếu còn chỗ trong pool (đầy thì bỏ prefetch, không chen trước request thật).
+    """
+    session = get_session_or_404(session_id)
+    answers_dict = {k: v for k, v in answers.dict().items() if v is not None}
+    if not answers_dict:
+        raise HTTPException(status_code=400, detail="No answers provided")
+    
+    # Validate hết trước khi ghi để một câu sai không làm phiên cập nhật dở dang
+    for q_id, answer in answers_dict.items():
+        question_choices = personality_system.discovery_questions[q_id]['choices']
+        if answer not in question_choices:
+            raise HTTPException(status_code=400, detail=f"Invalid answer '{answer}' for question {q_id}")
+    
+    for q_id, answer in answers_dict.items():
+        session.answer(q_id, answer)
+    
+    question, profiles = session.final_choice_profiles()
+    if question is not None:
+        if admission.try_acquire():
+            background_tasks.add_task(prefetch_final_answer_in_slot, session, question, dict(session.answers), profiles)
+        else:
+            session_store.prefetch_stats.record_skip()
+    return session_state(session)
+
+@app.get("/sessions/{session_id}/recommendations", response_model=RecommendationResult,
+         dependencies=[Depends(cpu_slot)])
+def recommend_for_quiz_session(session_id: str, top_n: int = 20):
+    """Gợi ý sách cho phiên đã trả lời đủ 8 câu (giống /discover với cùng câu trả lời)
+
+    Dùng kết quả tính trước cho câu cuối nếu còn khớp, không thì tính như /discover.
+    """
+    session = get_session_or_404(session_id)
+    if not session.is_complete:
+        raise HTTPException(status_code=400, detail=f"Session is not complete, next question: {session.next_question}")
+    
+    catalog = load_book_catalog()
+    prefetch = session.prefetch
+    body = prefetch.lookup(session.answers, top_n, catalog) if prefetch is not None else None
+    session_store.prefetch_stats.record_lookup(prefetch, body is not None)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+    
+    profile = session.profile()
+    ranked = catalog.engine.get_ranking(profile['primary_group'], profile['is_synthesizer'], top_n=top_n)
+    return render_recommendation_result(catalog, ranked, top_n, build_profile_response(profile))
+
+@app.delete("/sessions/{session_id}")
+async def delete_quiz_session(session_id: str):
+    """Kết thúc phiên"""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"deleted": session_id}
+
+@app.get("/books", response_model=BookListResponse, dependencies=[Depends(cpu_slot)])
+def get_books(
     page: int = 1,
     page_size: int = 20,
     category: Optional[str] = None,
     author: Optional[str] = None,
-    title: Optional[str] = None
+    title: Optional[str] = None,
+    cursor: Optional[str] = None,
+    format: str = "json"
 ):
     """Lấy danh sách sách với phân trang và lọc
     
@@ -1211,6 +1203,10 @@ async def get_books(
         category: Lọc theo category (tìm kiếm tương đối)
         author: Lọc theo tác giả (tìm kiếm tương đối)
         title: Lọc theo tiêu đề (tìm kiếm tương đối)
+        cursor: Phân trang theo cursor (sắp theo product_id); chuỗi rỗng là trang đầu,
+            các trang sau dùng next_cursor của response trước
+        format: 'json' hoặc 'ndjson'; ndjson stream mọi sách khớp từ trang/cursor
+            hiện tại tới hết (bỏ qua page_size), dòng đầu là {"total": ...}
     """
     try:
         # Validate parameters
@@ -1219,80 +1215,91 @@ async def get_books(
         if page_size < 1 or page_size > 100:
             raise HTTPException(status_code=400, detail="Page size must be between 1 and 100")
         
-        # Load book database
-        book_df = load_book_database()
-        
-        # Apply filters
-        filtered_df = book_df.copy()
-        
-        if category:
-            category_lower = category.lower()
-            filtered_df = filtered_df[
-                filtered_df['category'].str.lower().str.contains(category_lower, na=False, regex=False)
-            ]
-        
-        if author:
-            author_lower = author.lower()
-            filtered_df = filtered_df[
-                filtered_df['authors'].str.lower().str.contains(author_lower, na=False, regex=False)
-            ]
+        stream = check_response_format(format)
+        catalog = load_book_catalog()
+        filters = {'category': category, 'author': author, 'title': title}
+        
+        if cursor is not None:
+            # Chế độ cursor: thứ tự ổn định theo product_id, mỗi trang chỉ tìm nhị phân sau key cuối
+            after_key = None
+            if cursor:
+                cursor_filters, after_key, page = decode_books_cursor(cursor)
+                for name, value in filters.items():
+                    if value is not None and value != cursor_filters.get(name):
+                        raise HTTPException(status_code=400, detail=f"Filter '{name}' does not match cursor")
+                filters = {name: cursor_filters.get(name) for name in filters}
+            else:
+                page = 1
+            
+            if stream:
+                positions, _, total = catalog.keyset_page(after_key, len(catalog), **filters)
+                return stream_ndjson({'total': total}, map(catalog.fragments.list_item, positions))
+            
+            positions, last_key, total = catalog.keyset_page(after_key, page_size, **filters)
+            total_pages = (total + page_size - 1) // page_size
+            has_next = page * page_size < total and last_key is not None
+            
+            return render_book_list(
+                catalog,
+                positions,
+                total=total,
+                page=page,
+                page_size=page_size,
+                total_pages=total_pages,
+                has_next=has_next,
+                has_prev=page > 1,
+                next_cursor=encode_books_cursor(filters, last_key, page + 1) if has_next else None
+            )
         
-        if title:
-            title_lower = title.lower()
-            filtered_df = filtered_df[
-                filtered_df['title'].str.lower().str.contains(title_lower, na=False, regex=False)
-            ]
+        # Lọc qua index trigram của catalog, chỉ lấy vị trí dòng (không copy DataFrame)
+        filtered_positions = catalog.filter_books(**filters)
         
         # Calculate pagination
-        total = len(filtered_df)
+        total = len(filtered_positions)
         total_pages = (total + page_size - 1) // page_size  # Ceiling division
         
         # Get paginated results
         start_idx = (page - 1) * page_size
         end_idx = start_idx + page_size
-        paginated_df = filtered_df.iloc[start_idx:end_idx]
         
-        # Convert to BookListItem objects
-        books = []
-        for _, book_row in paginated_df.iterrows():
-            books.append(create_book_list_item(book_row))
+        if stream:
+            return stream_ndjson({'total': total}, map(catalog.fragments.list_item, filtered_positions[start_idx:]))
         
-        return BookListResponse(
-            books=books,
+        # Ghép JSON dựng sẵn của từng sách thay vì tạo BookListItem
+        return render_book_list(
+            catalog,
+            filtered_positions[start_idx:end_idx],
             total=total,
             page=page,
             page_size=page_size,
             total_pages=total_pages,
             has_next=page < total_pages,
-            has_prev=page > 1
+            has_prev=page > 1,
+            next_cursor=None
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting books: {str(e)}")
 
-@app.get("/books/{product_id}", response_model=BookDetail)
-async def get_book_detail(product_id: str):
+@app.get("/books/{product_id}", response_model=BookDetail, dependencies=[Depends(cpu_slot)])
+def get_book_detail(product_id: str):
     """Lấy thông tin chi tiết của một cuốn sách
     
     Args:
         product_id: ID sản phẩm của cuốn sách
     """
     try:
-        # Load book database
-        book_df = load_book_database()
-        
-        # Find book by product_id
-        # Convert product_id to string for comparison since it might be stored as different types
-        book_matches = book_df[book_df['product_id'].astype(str) == str(product_id)]
+        # Find book by product_id qua index của catalog (trùng product_id thì lấy dòng đầu tiên)
+        catalog = load_book_catalog()
+        position = catalog.find_book(product_id)
         
-        if len(book_matches) == 0:
+        if position is None:
             raise HTTPException(status_code=404, detail=f"Book with product_id '{product_id}' not found")
         
-        # Get the first match (should be unique)
-        book_row = book_matches.iloc[0]
-        
-        # Convert to BookDetail object
-        return create_book_detail(book_row)
+        # Convert to BookDetail object (preview 100 từ đầu của content đã tính sẵn khi load)
+        return create_book_detail(catalog.record(position))
         
     except HTTPException:
         # Re-raise HTTP exceptions as-is
@@ -1311,8 +1318,8 @@ async def get_personality_groups():
         }
     }
 
-@app.get("/stats")
-async def get_system_stats():
+@app.get("/stats", dependencies=[Depends(cpu_slot)])
+def get_system_stats():
     """Lấy thống kê hệ thống"""
     try:
         # Đếm số câu hỏi
@@ -1321,10 +1328,12 @@ async def get_system_stats():
         
         # Đếm số sách (nếu có database)
         num_books = 0
+        catalog_stats = None
         try:
-            book_df = pd.read_csv('dataset/books_full_data.csv')
-            num_books = len(book_df)
-        except:
+            catalog = get_catalog()
+            num_books = len(catalog)
+            catalog_stats = catalog.stats()
+        except FileNotFoundError:
             pass
         
         return {
@@ -1333,6 +1342,7 @@ async def get_system_stats():
             "total_questions": num_discovery_questions + num_professional_questions,
             "total_personality_groups": len(personality_system.groups),
             "total_books": num_books,
+            "catalog": catalog_stats,
             "synthesizer_available": True,
             "journey_types": ["discovery", "professional"],
             "api_version": "1.0.0"
@@ -1340,17 +1350,28 @@ async def get_system_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting stats: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Độ trễ event loop và tải của thread pool (chạy trên event loop nên vẫn trả lời khi pool đầy)"""
+    return {
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "workers": admission.stats(),
+        "sessions": session_store.stats(),
+        "prefetch": session_store.prefetch_stats.stats(),
+        "profile_atlas": profile_atlas.stats() if profile_atlas is not None else None
+    }
+
 # === DEVELOPMENT ENDPOINTS ===
 
-@app.post("/test/example")
-async def test_example():
+@app.post("/test/example", dependencies=[Depends(cpu_slot)])
+def test_example():
     """Test với ví dụ từ documentation"""
     example_answers = PersonalityAnswers(
         Q1="C", Q2="D", Q3="E", Q4="C", 
         Q5="B", Q6="E", Q7="C", Q8="C"
     )
     
-    result = await analyze_personality(example_answers)
+    result = analyze_personality(example_answers)
     return {
         "test_case": "Documentation example",
         "expected": "Thinker–Synthesizer", 
@@ -0,0 +1,292 @@
+"""
+Atlas profile: profile khám phá của mọi tổ hợp câu trả lời Q1-Q8
+Không gian câu trả lời nhỏ (5·5·5·3·3·5·5·3 = 84.375 tổ hợp) nên tính hết một lần
+bằng calculate_discovery_profiles_batch và lưu thành mảng tra cứu: vị trí của bộ
+câu trả lời → mã profile. API memory-map mảng này để tra profile trong O(1)
+thay vì tính điểm cho từng request.
+
+Vị trí của một bộ câu trả lời là số hỗn hợp cơ số: mỗi câu là một chữ số, cơ số
+là số lựa chọn của câu đó (Q1 có trọng số lớn nhất, A=0).
+
+Cấu trúc thư mục atlas:
+    manifest.json    version, dấu vân tay bộ câu hỏi, thứ tự câu/lựa chọn/nhóm, cột của profiles
+    atlas.npy        uint16, mã profile cho từng bộ câu trả lời
+    profiles.npy     int8, mỗi dòng một profile khác nhau
+
+Cách dùng:
+    python caelio_atlas.py build       # ghi atlas (mặc định ./profile_atlas)
+    python caelio_atlas.py report      # thống kê trên toàn không gian câu trả lời
+    python caelio_atlas.py benchmark   # so sánh tra atlas với calculate_discovery_profile
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+from caelio_personality_system import CaelioPersonalitySystem
+
+# Tăng khi đổi định dạng file; atlas khác version sẽ bị bỏ qua
+ATLAS_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+ATLAS_FILE = 'atlas.npy'
+PROFILES_FILE = 'profiles.npy'
+
+# Cột của profiles.npy (theo sau là điểm từng nhóm theo group_names)
+PROFILE_COLUMNS = (
+    'primary_group', 'secondary_group', 'primary_score', 'secondary_score',
+    'synthesizer_score', 'is_synthesizer', 'is_multi_motivated'
+)
+
+
+def default_atlas_dir():
+    """Thư mục atlas: CAELIO_PROFILE_ATLAS_DIR hoặc profile_atlas/ cạnh module"""
+    return os.environ.get(
+        'CAELIO_PROFILE_ATLAS_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profile_atlas')
+    )
+
+
+def question_fingerprint(system):
+    """sha256 của những gì quyết định profile: thứ tự câu/lựa chọn, nhóm và cờ Synthesizer"""
+    spec = {
+        'groups': system.group_names,
+        'questions': [
+            [q_id, [[choice, data['group'], bool(data.get('synthesizer', False))]
+                    for choice, data in question['choices'].items()]]
+            for q_id, question in system.discovery_questions.items()
+        ]
+    }
+    return hashlib.sha256(json.dumps(spec, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def answer_strides(choice_counts):
+    """Trọng số của từng câu trong vị trí atlas (câu cuối có trọng số 1)"""
+    choice_counts = np.asarray(choice_counts, dtype=np.int64)
+    strides = np.ones(len(choice_counts), dtype=np.int64)
+    strides[:-1] = np.cumprod(choice_counts[::-1])[::-1][1:]
+    return strides
+
+
+def answer_space_codes(system):
+    """Mã lựa chọn (số tổ hợp × 8) của toàn bộ không gian, theo đúng thứ tự vị trí trong atlas"""
+    counts = tuple(int(count) for count in system.choice_counts)
+    return np.indices(counts, dtype=np.uint8).reshape(len(counts), -1).T
+
+
+def _save_array(atlas_dir, file_name, array):
+    file_path = os.path.join(atlas_dir, file_name)
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(temp_path, file_path)
+
+
+def build_atlas(system, atlas_dir=None):
+    """Tính profile cho toàn bộ không gian câu trả lời và ghi atlas; trả về manifest
+
+    Manifest được ghi sau cùng (qua file tạm) nên nhiều process cùng build
+    không để lại atlas dở dang.
+    """
+    atlas_dir = atlas_dir or default_atlas_dir()
+    os.makedirs(atlas_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    batch = system.calculate_discovery_profiles_batch(answer_space_codes(system))
+    columns = np.column_stack([batch[name] for name in PROFILE_COLUMNS] + [batch['all_scores']]).astype(np.int8)
+    profiles, atlas = np.unique(columns, axis=0, return_inverse=True)
+    if len(profiles) > np.iinfo(np.uint16).max:
+        raise ValueError(f"Too many distinct profiles for a uint16 atlas: {len(profiles)}")
+
+    _save_array(atlas_dir, ATLAS_FILE, atlas.reshape(-1).astype(np.uint16))
+    _save_array(atlas_dir, PROFILES_FILE, profiles)
+
+    manifest = {
+        'atlas_version': ATLAS_VERSION,
+        'fingerprint': question_fingerprint(system),
+        'question_ids': system.discovery_question_ids,
+        'choice_codes': system.discovery_choice_codes,
+        'group_names': system.group_names,
+        'profile_columns': list(PROFILE_COLUMNS),
+        'combinations': int(len(atlas)),
+        'distinct_profiles': int(len(profiles)),
+        'build_seconds': round(time.perf_counter() - started, 3)
+    }
+    manifest_path = os.path.join(atlas_dir, MANIFEST_FILE)
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest
+
+
+class ProfileAtlas:
+    """Tra profile khám phá từ atlas đã memory-map
+
+    Dict của từng profile khác nhau được dựng sẵn khi load (khoảng một nghìn
+    profile), nên mỗi lần tra chỉ là cộng trọng số 8 câu và đọc một phần tử.
+    """
+
+    def __init__(self, system, atlas, profiles, manifest, atlas_dir):
+        self.atlas = atlas
+        self.profiles = profiles
+        self.manifest = manifest
+        self.atlas_dir = atlas_dir
+        self.strides = answer_strides(system.choice_counts)
+
+        # Cộng trọng số: {câu: {lựa chọn: mã lựa chọn × trọng số của câu}}
+        self.choice_offsets = {
+            q_id: {choice: index * int(stride) for index, choice in enumerate(choices)}
+            for q_id, choices, stride in zip(system.discovery_question_ids, system.discovery_choice_codes, self.strides)
+        }
+
+        n_columns = len(PROFILE_COLUMNS)
+        batch = {name: profiles[:, index] for index, name in enumerate(PROFILE_COLUMNS)}
+        batch['all_scores'] = profiles[:, n_columns:]
+        self.profile_dicts = [system.profile_from_batch(batch, index) for index in range(len(profiles))]
+
+    def __len__(self):
+        return len(self.atlas)
+
+    def profile_id(self, answers):
+        """Mã profile của bộ 8 câu trả lời (dict Q1-Q8); lựa chọn sai thì KeyError"""
+        index = 0
+        for q_id, offsets in self.choice_offsets.items():
+            index += offsets[answers[q_id]]
+        return int(self.atlas[index])
+
+    def profile_ids(self, codes):
+        """Mã profile cho mảng mã lựa chọn (N × 8)"""
+        return self.atlas[np.asarray(codes, dtype=np.int64) @ self.strides]
+
+    def resolve(self, answers):
+        """Profile (như calculate_discovery_profile) của bộ 8 câu trả lời"""
+        profile = self.profile_dicts[self.profile_id(answers)]
+        return {**profile, 'all_scores': dict(profile['all_scores'])}
+
+    def stats(self):
+        return {
+            'atlas_dir': self.atlas_dir,
+            'combinations': len(self.atlas),
+            'distinct_profiles': len(self.profiles),
+            'atlas_bytes': int(self.atlas.nbytes)
+        }
+
+
+def load_atlas(system, atlas_dir=None):
+    """Memory-map atlas; None nếu chưa build, khác version hoặc bộ câu hỏi đã đổi"""
+    atlas_dir = atlas_dir or default_atlas_dir()
+    try:
+        with open(os.path.join(atlas_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('atlas_version') != ATLAS_VERSION or manifest.get('fingerprint') != question_fingerprint(system):
+        return None
+
+    try:
+        atlas = np.load(os.path.join(atlas_dir, ATLAS_FILE), mmap_mode='r')
+        profiles = np.load(os.path.join(atlas_dir, PROFILES_FILE))
+    except (OSError, ValueError):
+        return None
+    if atlas.shape != (manifest['combinations'],) or len(profiles) != manifest['distinct_profiles']:
+        return None
+    return ProfileAtlas(system, atlas, profiles, manifest, atlas_dir)
+
+
+def ensure_atlas(system, atlas_dir=None):
+    """Load atlas, build trước nếu chưa có hoặc đã cũ; None nếu không ghi được thư mục atlas"""
+    atlas = load_atlas(system, atlas_dir)
+    if atlas is None:
+        try:
+            build_atlas(system, atlas_dir)
+        except OSError:
+            return None
+        atlas = load_atlas(system, atlas_dir)
+    return atlas
+
+
+def atlas_report(atlas):
+    """Thống kê trên toàn không gian câu trả lời (mỗi tổ hợp cùng trọng số)"""
+    profiles = atlas.profiles
+    column = {name: profiles[:, index] for index, name in enumerate(PROFILE_COLUMNS)}
+    weights = np.bincount(np.asarray(atlas.atlas), minlength=len(profiles))
+    total = int(weights.sum())
+    group_names = atlas.manifest['group_names']
+
+    def share(mask):
+        return round(float(weights[mask].sum()) / total, 4)
+
+    def distribution(keys):
+        counts = {}
+        for key, weight in zip(keys, weights):
+            counts[key] = counts.get(key, 0) + int(weight)
+        return {key: round(count / total, 4) for key, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)}
+
+    profile_names = [
+        group_names[primary] + ("–Synthesizer" if synthesizer else "")
+        for primary, synthesizer in zip(column['primary_group'], column['is_synthesizer'])
+    ]
+    return {
+        'combinations': total,
+        'distinct_profiles': len(profiles),
+        'synthesizer_share': share(column['is_synthesizer'] == 1),
+        'tie_share': share(column['primary_score'] == column['secondary_score']),
+        'multi_motivated_share': share(column['is_multi_motivated'] == 1),
+        'primary_group': distribution(group_names[code] for code in column['primary_group']),
+        'profile_name': distribution(profile_names),
+        'synthesizer_score': dict(sorted(distribution(column['synthesizer_score'].tolist()).items()))
+    }
+
+
+def benchmark(system, atlas, samples=20000, seed=0):
+    """Thời gian tra atlas so với calculate_discovery_profile trên các bộ câu trả lời ngẫu nhiên"""
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, system.choice_counts, size=(samples, len(system.choice_counts)))
+    answer_sets = [
+        {q_id: choices[code] for q_id, choices, code in zip(system.discovery_question_ids, system.discovery_choice_codes, row)}
+        for row in codes.tolist()
+    ]
+
+    started = time.perf_counter()
+    expected = [system.calculate_discovery_profile(answers) for answers in answer_sets]
+    scalar_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    resolved = [atlas.resolve(answers) for answers in answer_sets]
+    atlas_seconds = time.perf_counter() - started
+    if resolved != expected:
+        raise AssertionError("Atlas does not match calculate_discovery_profile")
+
+    print(f"calculate_discovery_profile: {scalar_seconds / samples * 1e6:.2f} µs/profile")
+    print(f"atlas.resolve:               {atlas_seconds / samples * 1e6:.2f} µs/profile")
+
+
+def main(argv):
+    command = argv[0] if argv else 'build'
+    atlas_dir = argv[1] if len(argv) > 1 else default_atlas_dir()
+    system = CaelioPersonalitySystem()
+
+    if command == 'build':
+        manifest = build_atlas(system, atlas_dir)
+        print(f"✅ Built atlas {atlas_dir}: {manifest['combinations']} combinations, "
+              f"{manifest['distinct_profiles']} profiles in {manifest['build_seconds']:.2f}s")
+        return 0
+
+    atlas = ensure_atlas(system, atlas_dir)
+    if atlas is None:
+        print(f"❌ Could not build atlas in {atlas_dir}")
+        return 1
+    if command == 'report':
+        print(json.dumps(atlas_report(atlas), ensure_ascii=False, indent=2))
+    elif command == 'benchmark':
+        benchmark(system, atlas)
+    else:
+        print(f"❌ Unknown command: {command}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
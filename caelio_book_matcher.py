@@ -3,13 +3,30 @@ Tích hợp hệ thống Caelio với dữ liệu sách
 Mapping từ 5 nhóm tính cách + Synthesizer sang categories sách
 """
 
+import numpy as np
 import pandas as pd
 from caelio_personality_system import CaelioPersonalitySystem
+from caelio_snapshot import read_book_data
+
+# Mapping keywords cho một số categories phổ biến
+KEYWORD_MAPS = {
+    'tâm lý': ['psychology', 'tâm lí', 'tâm thần', 'mental'],
+    'kinh doanh': ['business', 'bán hàng', 'marketing', 'quản trị', 'startup'],
+    'khoa học': ['science', 'kỹ thuật', 'công nghệ', 'technology'],
+    'văn học': ['literature', 'tiểu thuyết', 'truyện', 'tác phẩm'],
+    'nghệ thuật': ['art', 'hội họa', 'thiết kế', 'design'],
+    'du lịch': ['travel', 'du ký', 'phiêu lưu'],
+    'sức khỏe': ['health', 'y học', 'medical', 'làm đẹp'],
+    'tài chính': ['finance', 'tiền tệ', 'đầu tư', 'investment', 'chứng khoán']
+}
 
 class CaelioBookMatcher:
     def __init__(self):
         self.personality_system = CaelioPersonalitySystem()
         
+        # Cache điểm theo (nhóm, synthesizer) -> {category: điểm hoặc None}
+        self._category_score_cache = {}
+        
         # Mapping từ nhóm tính cách sang book categories
         self.personality_to_categories = {
             'Kết nối': {
@@ -129,65 +146,83 @@ class CaelioBookMatcher:
     def map_personality_to_books(self, profile, book_df):
         """
         Lọc sách phù hợp dựa trên personality profile với fuzzy matching
+        
+        Điểm được tính một lần cho mỗi category khác nhau rồi map ngược về từng sách
+        qua mã category, nên chi phí tỉ lệ với số category chứ không phải số sách.
         """
         primary_group = profile['primary_group']
         is_synthesizer = profile['is_synthesizer']
         
-        # Lấy danh sách categories phù hợp
-        if is_synthesizer:
-            target_categories = (
-                self.personality_to_categories[primary_group]['base'] +
-                self.personality_to_categories[primary_group]['synthesizer']
-            )
-        else:
-            target_categories = self.personality_to_categories[primary_group]['base']
+        # Điểm theo category (None nếu category không khớp nhóm tính cách)
+        categories = book_df['category'].astype('category')
+        category_scores = self._category_scores(primary_group, is_synthesizer, categories.cat.categories)
         
-        # Sử dụng fuzzy matching thay vì exact match
-        def matches_any_target(actual_category):
-            if pd.isna(actual_category):
-                return False
-            actual_lower = str(actual_category).lower()
-            for target in target_categories:
-                target_lower = target.lower()
-                # Exact match
-                if actual_lower == target_lower:
-                    return True
-                # Substring match (cả 2 chiều)
-                if target_lower in actual_lower or actual_lower in target_lower:
-                    return True
-                # Keyword matching cho một số cases đặc biệt
-                if self._keyword_match(actual_lower, target_lower):
-                    return True
-            return False
+        # Join theo mã category; mã -1 (NaN) trỏ vào phần tử NaN cuối mảng
+        score_table = np.append(
+            np.array([np.nan if score is None else score for score in category_scores], dtype=np.float64),
+            np.nan
+        )
+        book_scores = score_table[categories.cat.codes.to_numpy()]
+        matched_mask = ~np.isnan(book_scores)
         
         # Lọc sách theo categories với fuzzy matching
-        matched_books = book_df[book_df['category'].apply(matches_any_target)].copy()
+        matched_books = book_df[matched_mask].copy()
         
         # Thêm matching score
-        matched_books['personality_match_score'] = matched_books['category'].apply(
-            lambda cat: self._calculate_match_score_fuzzy(cat, primary_group, is_synthesizer, target_categories)
-        )
+        matched_books['personality_match_score'] = book_scores[matched_mask]
         
         # Sắp xếp theo độ phù hợp
         matched_books = matched_books.sort_values('personality_match_score', ascending=False)
         
         return matched_books
     
+    def _target_categories(self, primary_group, is_synthesizer):
+        """Danh sách categories phù hợp với nhóm tính cách"""
+        if is_synthesizer:
+            return (
+                self.personality_to_categories[primary_group]['base'] +
+                self.personality_to_categories[primary_group]['synthesizer']
+            )
+        return self.personality_to_categories[primary_group]['base']
+    
+    def _category_scores(self, primary_group, is_synthesizer, categories):
+        """Điểm phù hợp cho từng category, cache theo profile để không tính lại"""
+        cache = self._category_score_cache.setdefault((primary_group, bool(is_synthesizer)), {})
+        target_categories = self._target_categories(primary_group, is_synthesizer)
+        
+        scores = []
+        for category in categories:
+            if category not in cache:
+                if self._matches_any_target(category, target_categories):
+                    cache[category] = self._calculate_match_score_fuzzy(
+                        category, primary_group, is_synthesizer, target_categories
+                    )
+                else:
+                    cache[category] = None
+            scores.append(cache[category])
+        return scores
+    
+    def _matches_any_target(self, actual_category, target_categories):
+        """Sử dụng fuzzy matching thay vì exact match"""
+        if pd.isna(actual_category):
+            return False
+        actual_lower = str(actual_category).lower()
+        for target in target_categories:
+            target_lower = target.lower()
+            # Exact match
+            if actual_lower == target_lower:
+                return True
+            # Substring match (cả 2 chiều)
+            if target_lower in actual_lower or actual_lower in target_lower:
+                return True
+            # Keyword matching cho một số cases đặc biệt
+            if self._keyword_match(actual_lower, target_lower):
+                return True
+        return False
+    
     def _keyword_match(self, actual_lower, target_lower):
         """Kiểm tra keyword matching cho các cases đặc biệt"""
-        # Mapping keywords cho một số categories phổ biến
-        keyword_maps = {
-            'tâm lý': ['psychology', 'tâm lí', 'tâm thần', 'mental'],
-            'kinh doanh': ['business', 'bán hàng', 'marketing', 'quản trị', 'startup'],
-            'khoa học': ['science', 'kỹ thuật', 'công nghệ', 'technology'],
-            'văn học': ['literature', 'tiểu thuyết', 'truyện', 'tác phẩm'],
-            'nghệ thuật': ['art', 'hội họa', 'thiết kế', 'design'],
-            'du lịch': ['travel', 'du ký', 'phiêu lưu'],
-            'sức khỏe': ['health', 'y học', 'medical', 'làm đẹp'],
-            'tài chính': ['finance', 'tiền tệ', 'đầu tư', 'investment', 'chứng khoán']
-        }
-        
-        for key_target, related_words in keyword_maps.items():
+        for key_target, related_words in KEYWORD_MAPS.items():
             if key_target in target_lower:
                 for word in related_words:
                     if word in actual_lower:
@@ -303,9 +338,9 @@ def demo_personality_matching():
     # Khởi tạo
     matcher = CaelioBookMatcher()
     
-    # Load dữ liệu sách (giả sử có file CSV)
+    # Load dữ liệu sách (snapshot dạng cột nếu đã build, không thì CSV)
     try:
-        book_df = pd.read_csv('dataset/books_full_data.csv')
+        book_df = read_book_data('dataset/books_full_data.csv')[0]
         print(f"📚 Loaded {len(book_df)} books")
     except:
         # Tạo dữ liệu mẫu nếu không có file
@@ -355,7 +390,7 @@ def create_personality_labeled_dataset():
     
     try:
         # Load dataset
-        book_df = pd.read_csv('dataset/books_full_data.csv')
+        book_df = read_book_data('dataset/books_full_data.csv')[0]
         print(f"📚 Processing {len(book_df)} books...")
         
         # Phân tích compatibility
@@ -0,0 +1,496 @@
+"""
+Catalog sách dùng chung cho Caelio API
+Load dữ liệu sách một lần, chia sẻ cho mọi endpoint và hoán đổi nguyên tử khi reload
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from caelio_keyword_matcher import KeywordHitMatrix
+from caelio_keywords import get_matching_vocabulary
+from caelio_recommender import RecommendationEngine
+from caelio_records import BookFragments, build_book_records
+from caelio_snapshot import (CONTENT_PREVIEW, TextColumn, content_preview, file_signature, load_derived_arrays,
+                             read_book_data, save_derived_arrays)
+from caelio_text_index import INDEX_FORMAT, INDEXED_COLUMNS, BookTextIndex
+
+# Thứ tự ưu tiên file dữ liệu sách (giống fallback cũ của API)
+BOOK_DATA_FILES = [
+    'dataset/books_full_data.csv',
+    'books_full_data.csv',
+    '../dataset/books_full_data.csv',
+    'v2/labeled_books_v2.csv'
+]
+
+COMMENT_DATA_FILES = [
+    'dataset/comments.csv',
+    'comments.csv',
+    '../dataset/comments.csv',
+    'data/comment_eda.csv'
+]
+
+# Chu kỳ (giây) kiểm tra file dữ liệu thay đổi
+WATCH_INTERVAL = float(os.environ.get('CAELIO_CATALOG_WATCH_INTERVAL', '5'))
+
+# Số bình luận tính sẵn cho mỗi sách (trang chi tiết hiển thị 5 bình luận đầu)
+COMMENTS_PER_BOOK = 5
+
+# Số kết quả lọc /books được giữ lại để các trang sau không phải lọc lại
+FILTER_CACHE_SIZE = 128
+
+# Các cột số được ép kiểu ngay khi load để endpoint không phải parse lại
+NUMERIC_COLUMNS = ['original_price', 'current_price', 'quantity', 'n_review', 'avg_rating', 'pages']
+
+# Cột văn bản dài không nằm trong DataFrame: lưu dạng TextColumn (memory-map khi load từ snapshot)
+LAZY_TEXT_COLUMNS = ['summary', 'content']
+
+# Tên mảng ma trận keyword trong snapshot (dùng chung giữa các worker qua memory-map)
+KEYWORD_WEIGHTS = 'keyword_weights'
+
+# Cột có ít giá trị khác nhau -> lưu dạng category cho gọn bộ nhớ
+CATEGORICAL_COLUMNS = ['category', 'manufacturer']
+
+
+def resolve_data_file(candidates):
+    """Trả về file đầu tiên tồn tại trong danh sách, hoặc None"""
+    for file_path in candidates:
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+
+def safe_string_value(value, default=''):
+    """Safely convert value to string, handling NaN"""
+    if pd.isna(value):
+        return default
+    return str(value) if value is not None else default
+
+
+def safe_int_value(value, default=0):
+    """Chuyển sang int, giá trị thiếu hoặc không phải số thành default"""
+    value = pd.to_numeric(value, errors='coerce')
+    return int(value) if pd.notna(value) else default
+
+
+def normalize_product_id(value):
+    """Chuẩn hóa product_id về chuỗi để tra cứu (74021317, 74021317.0, ' 74021317' như nhau)"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if pd.isna(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    return str(value).strip()
+
+
+def build_product_index(book_df):
+    """Index product_id -> vị trí dòng; product_id trùng thì giữ dòng xuất hiện đầu tiên"""
+    product_index = {}
+    if 'product_id' not in book_df.columns:
+        return product_index
+    for position, product_id in enumerate(book_df['product_id']):
+        key = normalize_product_id(product_id)
+        if key is not None and key not in product_index:
+            product_index[key] = position
+    return product_index
+
+
+def build_keyset(book_df):
+    """Thứ tự ổn định cho phân trang cursor: (product_id chuẩn hóa, lần xuất hiện)
+
+    Trả về (danh sách key đã sắp xếp, vị trí dòng theo thứ tự đó, thứ hạng của từng dòng).
+    Key không phụ thuộc vị trí dòng nên cursor vẫn đúng sau khi reload catalog.
+    """
+    product_ids = book_df['product_id'] if 'product_id' in book_df.columns else [None] * len(book_df)
+    occurrences = {}
+    keys = []
+    for product_id in product_ids:
+        key = normalize_product_id(product_id) or ''
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        keys.append((key, occurrence))
+
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys), dtype=np.int64)
+    return [keys[position] for position in order], np.array(order, dtype=np.int64), ranks
+
+
+def build_category_codes(book_df):
+    """Mã category của từng sách và nhãn tương ứng; mã -1 (thiếu) trỏ tới nhãn '' ở cuối"""
+    if 'category' not in book_df.columns:
+        return np.full(len(book_df), -1, dtype=np.int64), ['']
+    categories = book_df['category'].cat
+    labels = [str(category) for category in categories.categories] + ['']
+    return categories.codes.to_numpy(dtype=np.int64), labels
+
+
+def build_comment_index(comments_df, limit=COMMENTS_PER_BOOK):
+    """Gom bình luận theo product_id: tối đa `limit` bình luận đầu tiên, bỏ trùng comment_id
+
+    Mỗi bình luận đã được chuẩn hóa (NaN -> giá trị mặc định) thành dict sẵn sàng
+    cho model Comment, nên trang chi tiết chỉ cần một lần tra dict.
+    """
+    comment_index = {}
+    if comments_df is None or comments_df.empty:
+        return comment_index
+    if 'product_id' not in comments_df.columns or 'comment_id' not in comments_df.columns:
+        return comment_index
+
+    seen_ids = {}
+    for row in comments_df.to_dict('records'):
+        key = normalize_product_id(row['product_id'])
+        if key is None:
+            continue
+        comments = comment_index.setdefault(key, [])
+        if len(comments) >= limit:
+            continue
+
+        comment_id = row['comment_id']
+        dedupe_key = None if pd.isna(comment_id) else comment_id
+        product_seen = seen_ids.setdefault(key, set())
+        if dedupe_key in product_seen:
+            continue
+        product_seen.add(dedupe_key)
+
+        comments.append({
+            'comment_id': safe_string_value(comment_id),
+            'title': safe_string_value(row.get('title', '')),
+            'customer_id': safe_string_value(row.get('customer_id', '')),
+            'rating': safe_int_value(row.get('rating')),
+            'content': safe_string_value(row.get('content', '')),
+            'thank_count': safe_int_value(row.get('thank_count'))
+        })
+    return comment_index
+
+
+def lowercase_text(book_df, column):
+    """Cột văn bản đã lowercase, giá trị thiếu thành chuỗi rỗng"""
+    if column not in book_df.columns:
+        return [''] * len(book_df)
+    return [str(value).lower() if pd.notna(value) else '' for value in book_df[column]]
+
+
+def lowercase_lazy_text(text_columns, column, total):
+    """Như lowercase_text cho TextColumn, sinh từng giá trị để không giữ cả cột trong RAM"""
+    if column not in text_columns:
+        return [''] * total
+    return (value.lower() if value is not None else '' for value in text_columns[column])
+
+
+def build_keyword_matrix(book_df, text_columns):
+    """Tính sẵn ma trận keyword cho toàn bộ vocabulary dùng khi chấm điểm"""
+    return KeywordHitMatrix(
+        get_matching_vocabulary(),
+        lowercase_text(book_df, 'category'),
+        lowercase_text(book_df, 'title'),
+        lowercase_lazy_text(text_columns, 'summary', len(book_df)),
+        lowercase_lazy_text(text_columns, 'content', len(book_df))
+    )
+
+
+def snapshot_arrays(snapshot_dir, names, build, **meta):
+    """Mảng tính sẵn lấy từ snapshot (memory-map) nếu có đủ và khớp `meta`, không thì build()
+
+    Lần đầu tính từ một snapshot thì ghi luôn vào snapshot để các process sau
+    (worker khác, lần khởi động sau) chỉ việc map file thay vì giữ bản riêng.
+    """
+    if snapshot_dir:
+        arrays = load_derived_arrays(snapshot_dir, 'books', names, **meta)
+        if arrays is not None:
+            return arrays
+
+    arrays = build()
+    if snapshot_dir:
+        try:
+            save_derived_arrays(snapshot_dir, 'books', arrays, **meta)
+        except OSError as e:
+            print(f"⚠️ Could not store {', '.join(names)} in snapshot {snapshot_dir} ({e})")
+    return arrays
+
+
+def load_keyword_matrix(book_df, text_columns, snapshot_dir=None):
+    """Ma trận keyword cho vocabulary hiện tại (memory-map từ snapshot nếu đã tính)"""
+    vocabulary = list(dict.fromkeys(get_matching_vocabulary()))
+    arrays = snapshot_arrays(
+        snapshot_dir, [KEYWORD_WEIGHTS],
+        lambda: {KEYWORD_WEIGHTS: build_keyword_matrix(book_df, text_columns).weights},
+        vocabulary=vocabulary
+    )
+    return KeywordHitMatrix.from_weights(vocabulary, arrays[KEYWORD_WEIGHTS])
+
+
+def load_text_index(book_df, snapshot_dir=None):
+    """Index lọc category/author/title (posting list memory-map từ snapshot nếu đã tính)"""
+    names = [f"text_index.{name}.{part}" for name in INDEXED_COLUMNS for part in ('keys', 'offsets', 'rows')]
+
+    built = []
+
+    def build():
+        built.append(BookTextIndex(book_df))
+        return {
+            f"text_index.{name}.{part}": array
+            for name, index_arrays in built[0].arrays().items()
+            for part, array in index_arrays.items()
+        }
+
+    arrays = snapshot_arrays(snapshot_dir, names, build, index_format=INDEX_FORMAT)
+    if built:
+        return built[0]
+    return BookTextIndex(book_df, {
+        name: {part: arrays[f"text_index.{name}.{part}"] for part in ('keys', 'offsets', 'rows')}
+        for name in INDEXED_COLUMNS
+    })
+
+
+def split_text_columns(book_df, text_columns=None):
+    """Tách summary/content khỏi DataFrame thành TextColumn, kèm preview content tính sẵn"""
+    text_columns = dict(text_columns or {})
+    for column in LAZY_TEXT_COLUMNS:
+        if column not in text_columns and column in book_df.columns:
+            text_columns[column] = TextColumn.from_values(book_df[column])
+    if CONTENT_PREVIEW not in text_columns and 'content' in text_columns:
+        text_columns[CONTENT_PREVIEW] = TextColumn.from_values(
+            content_preview(value) for value in text_columns['content']
+        )
+    return book_df.drop(columns=[column for column in LAZY_TEXT_COLUMNS if column in book_df.columns]), text_columns
+
+
+def prepare_book_frame(book_df):
+    """Chuẩn hóa kiểu dữ liệu các cột của DataFrame sách"""
+    book_df = book_df.copy()
+    for column in NUMERIC_COLUMNS:
+        if column in book_df.columns:
+            book_df[column] = pd.to_numeric(book_df[column], errors='coerce').astype('float64')
+    for column in CATEGORICAL_COLUMNS:
+        if column in book_df.columns:
+            book_df[column] = book_df[column].astype('category')
+    return book_df
+
+
+class BookCatalog:
+    """Snapshot chỉ đọc của dữ liệu sách, được chia sẻ giữa các request
+
+    Không sửa đổi catalog sau khi tạo: muốn cập nhật thì tạo catalog mới
+    rồi gọi set_catalog() để hoán đổi.
+    """
+
+    def __init__(self, book_df, comments_df=None, source_path=None, comments_path=None, load_seconds=0.0,
+                 text_columns=None, snapshot_dir=None):
+        book_df, self.text_columns = split_text_columns(book_df, text_columns)
+        self.book_df = prepare_book_frame(book_df)
+        self.comment_index = build_comment_index(comments_df)
+        self.total_comments = len(comments_df) if comments_df is not None else 0
+        self.source_path = source_path
+        self.comments_path = comments_path
+        self.source_signatures = {}
+        self.snapshot_path = None
+        self.records = build_book_records(self.book_df, self.text_columns)
+        self.fragments = BookFragments(self.records)
+        self.category_codes, self.category_labels = build_category_codes(self.book_df)
+        self.product_index = build_product_index(self.book_df)
+        self.text_index = load_text_index(self.book_df, snapshot_dir)
+        self.keyset_keys, self.keyset_order, self.keyset_ranks = build_keyset(self.book_df)
+        self._filter_cache = OrderedDict()
+        self._filter_cache_lock = threading.Lock()
+        self.keyword_matrix = load_keyword_matrix(self.book_df, self.text_columns, snapshot_dir)
+        self.engine = RecommendationEngine(self.book_df, self.keyword_matrix)
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.memory_bytes = int(
+            self.book_df.memory_usage(deep=True).sum()
+            + (0 if self.keyword_matrix.mapped else self.keyword_matrix.weights.nbytes)
+            + sum(column.resident_bytes for column in self.text_columns.values())
+        )
+
+    @classmethod
+    def from_files(cls, book_file, comments_file=None):
+        """Đọc catalog (ưu tiên snapshot dạng cột, không có thì CSV) và ghi lại thời gian load"""
+        started = time.perf_counter()
+        # Lấy chữ ký trước khi đọc để thay đổi trong lúc đọc vẫn được phát hiện
+        signatures = {path: file_signature(path) for path in (book_file, comments_file) if path}
+        book_df, comments_df, manifest_path, text_columns = read_book_data(
+            book_file, comments_file, lazy_columns=LAZY_TEXT_COLUMNS
+        )
+        snapshot_dir = os.path.dirname(manifest_path) if manifest_path else None
+        catalog = cls(book_df, comments_df, source_path=book_file, comments_path=comments_file,
+                      text_columns=text_columns, snapshot_dir=snapshot_dir)
+        if manifest_path:
+            # Build lại snapshot cũng kích hoạt reload
+            signatures[manifest_path] = file_signature(manifest_path)
+        catalog.source_signatures = signatures
+        catalog.snapshot_path = manifest_path
+        catalog.load_seconds = time.perf_counter() - started
+        return catalog
+
+    def is_stale(self):
+        """Kiểm tra file nguồn đã thay đổi kể từ lần load này chưa"""
+        return any(
+            file_signature(path) != signature
+            for path, signature in self.source_signatures.items()
+        )
+
+    def __len__(self):
+        return len(self.book_df)
+
+    def record(self, position):
+        """BookRecord của sách ở vị trí dòng `position`"""
+        return self.records[position]
+
+    def get_text(self, column, position):
+        """Giá trị cột văn bản dài (summary, content, content_preview) của một sách, None nếu thiếu"""
+        text_column = self.text_columns.get(column)
+        return text_column[position] if text_column is not None else None
+
+    def get_comments(self, product_id, limit=COMMENTS_PER_BOOK):
+        """Các bình luận đầu tiên (đã bỏ trùng) của một sách"""
+        return self.comment_index.get(normalize_product_id(product_id), [])[:limit]
+
+    def find_book(self, product_id):
+        """Vị trí dòng của sách theo product_id (O(1)), None nếu không có"""
+        return self.product_index.get(normalize_product_id(product_id))
+
+    def _cached_filter(self, cache_key, compute):
+        """LRU nhỏ cho kết quả lọc theo (chế độ, category, author, title)"""
+        with self._filter_cache_lock:
+            if cache_key in self._filter_cache:
+                self._filter_cache.move_to_end(cache_key)
+                return self._filter_cache[cache_key]
+
+        result = compute()
+        with self._filter_cache_lock:
+            self._filter_cache[cache_key] = result
+            while len(self._filter_cache) > FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        return result
+
+    def filter_books(self, category=None, author=None, title=None):
+        """Vị trí các sách khớp bộ lọc, theo thứ tự gốc của catalog"""
+        return self._cached_filter(
+            ('positions', category, author, title),
+            lambda: self.text_index.filter(category=category, author=author, title=title)
+        )
+
+    def keyset_page(self, after_key=None, page_size=20, category=None, author=None, title=None):
+        """Một trang theo thứ tự keyset, bắt đầu sau `after_key`
+
+        Trả về (vị trí các sách trong trang, key của sách cuối trang, tổng số sách khớp).
+        Mỗi trang chỉ tốn một lần tìm nhị phân trên kết quả lọc đã cache.
+        """
+        ranks = self._cached_filter(
+            ('keyset', category, author, title),
+            lambda: np.sort(self.keyset_ranks[self.filter_books(category, author, title)])
+        )
+        start = 0
+        if after_key is not None:
+            start = int(np.searchsorted(ranks, bisect_right(self.keyset_keys, tuple(after_key))))
+
+        page_ranks = ranks[start:start + page_size]
+        last_key = self.keyset_keys[page_ranks[-1]] if len(page_ranks) > 0 else None
+        return self.keyset_order[page_ranks], last_key, len(ranks)
+
+    def stats(self):
+        """Thông tin về lần load catalog hiện tại"""
+        return {
+            'source': self.source_path,
+            'comments_source': self.comments_path,
+            'snapshot': self.snapshot_path,
+            'total_books': len(self),
+            'total_comments': self.total_comments,
+            'load_seconds': round(self.load_seconds, 4),
+            'memory_bytes': self.memory_bytes,
+            'mapped_text_columns': sorted(name for name, column in self.text_columns.items() if column.mapped),
+            'mapped_keyword_matrix': self.keyword_matrix.mapped,
+            'loaded_at': self.loaded_at
+        }
+
+
+def load_catalog(book_file=None, comments_file=None):
+    """Load catalog từ file chỉ định hoặc theo danh sách fallback"""
+    book_file = book_file or resolve_data_file(BOOK_DATA_FILES)
+    if book_file is None or not os.path.exists(book_file):
+        raise FileNotFoundError("Book database not found")
+    comments_file = comments_file or resolve_data_file(COMMENT_DATA_FILES)
+    return BookCatalog.from_files(book_file, comments_file)
+
+
+# === CATALOG DÙNG CHUNG TRONG PROCESS ===
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Lấy catalog hiện tại, load lần đầu nếu chưa có"""
+    catalog = _catalog
+    if catalog is not None:
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            set_catalog(load_catalog())
+        return _catalog
+
+
+def set_catalog(catalog):
+    """Hoán đổi catalog đang dùng (phép gán tham chiếu là nguyên tử)"""
+    global _catalog
+    _catalog = catalog
+    return catalog
+
+
+def reload_catalog(book_file=None, comments_file=None):
+    """Load lại catalog ngoài luồng request rồi mới hoán đổi"""
+    return set_catalog(load_catalog(book_file, comments_file))
+
+
+class CatalogWatcher(threading.Thread):
+    """Thread nền theo dõi file sách/bình luận và reload catalog khi thay đổi
+
+    Catalog mới (kèm các index) được dựng hoàn toàn trong thread này, request
+    đang chạy vẫn dùng catalog cũ cho tới khi con trỏ được hoán đổi.
+    """
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        super().__init__(name='caelio-catalog-watcher', daemon=True)
+        self.interval = interval
+        self.reload_count = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Reload nếu file nguồn đổi; trả về True khi đã hoán đổi catalog"""
+        current = _catalog
+        if current is not None and not current.is_stale():
+            return False
+
+        try:
+            if current is None:
+                catalog = load_catalog()
+            else:
+                catalog = load_catalog(current.source_path, current.comments_path)
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+        # File vẫn đang được ghi dở -> bỏ kết quả này, lần kiểm tra sau load lại
+        if catalog.is_stale():
+            return False
+
+        set_catalog(catalog)
+        self.reload_count += 1
+        self.last_error = None
+        print(f"🔄 Reloaded catalog: {len(catalog)} books in {catalog.load_seconds:.2f}s")
+        return True
+
+    def stop(self):
+        self._stop_event.set()
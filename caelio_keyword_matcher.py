@@ -0,0 +1,113 @@
+"""
+Bộ so khớp nhiều keyword cùng lúc (Aho–Corasick) cho việc chấm điểm sách
+Mỗi trường văn bản chỉ quét một lần thay vì kiểm tra `keyword in text` cho từng
+keyword; kết quả quét được dồn vào ma trận sách × keyword tính sẵn khi load catalog.
+"""
+
+from collections import deque
+import numpy as np
+
+# Trọng số khi keyword xuất hiện trong category, title, summary, content
+FIELD_WEIGHTS = (3, 2, 1, 0.5)
+
+
+class KeywordAutomaton:
+    """Automaton Aho–Corasick dựng một lần cho một danh sách pattern (không trùng lặp)"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._transitions, self._outputs = self._build(self.patterns)
+
+    @staticmethod
+    def _build(patterns):
+        """Dựng trie rồi chuyển thành bảng chuyển trạng thái đầy đủ (không cần đi fail link khi quét)"""
+        goto = [{}]
+        outputs = [set()]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = next_state
+                state = next_state
+            outputs[state].add(pattern_id)
+
+        fail = [0] * len(goto)
+        transitions = [None] * len(goto)
+        transitions[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = fail[state]
+            outputs[state] |= outputs[fallback]
+            transitions[state] = {**transitions[fallback], **goto[state]}
+            for char, next_state in goto[state].items():
+                fail[next_state] = transitions[fallback].get(char, 0) if state else 0
+                queue.append(next_state)
+
+        return transitions, [tuple(sorted(found)) for found in outputs]
+
+    def scan(self, text):
+        """Quét text một lần, trả về tập id các pattern xuất hiện"""
+        transitions = self._transitions
+        outputs = self._outputs
+        found = set(outputs[0])
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class KeywordHitMatrix:
+    """Ma trận sách × keyword chứa sẵn điểm theo trường (3/2/1/0.5)
+
+    Tính một lần khi load catalog; điểm keyword cho một profile khi đó chỉ là
+    tổng các cột của những keyword trong profile.
+    """
+
+    def __init__(self, vocabulary, categories, titles, summaries, contents):
+        self.vocabulary = list(dict.fromkeys(vocabulary))
+        self.column_of = {keyword: i for i, keyword in enumerate(self.vocabulary)}
+
+        # Pattern của automaton trùng với vocabulary nên pattern id chính là chỉ số cột
+        automaton = KeywordAutomaton(self.vocabulary)
+        self.weights = np.zeros((len(categories), len(self.vocabulary)), dtype=np.float64)
+        for weight, texts in zip(FIELD_WEIGHTS, (categories, titles, summaries, contents)):
+            for row, text in enumerate(texts):
+                for column in automaton.scan(text):
+                    self.weights[row, column] += weight
+
+    @classmethod
+    def from_weights(cls, vocabulary, weights):
+        """Dựng từ ma trận đã tính sẵn (ví dụ memory-map từ snapshot), không quét lại văn bản"""
+        matrix = cls.__new__(cls)
+        matrix.vocabulary = list(dict.fromkeys(vocabulary))
+        matrix.column_of = {keyword: i for i, keyword in enumerate(matrix.vocabulary)}
+        matrix.weights = weights
+        return matrix
+
+    @property
+    def mapped(self):
+        return isinstance(self.weights, np.memmap)
+
+    def match_scores(self, keywords):
+        """Điểm khớp keyword cho toàn bộ sách
+
+        Cộng từng cột theo đúng thứ tự keyword (kể cả keyword trùng) như vòng
+        `match_score += keyword_score / total_keywords` gốc, nên điểm giống hệt
+        từng bit và thứ tự các sách bằng điểm không đổi. Nhân ma trận cộng theo
+        thứ tự khác và làm lệch bit cuối.
+        """
+        scores = np.zeros(len(self.weights), dtype=np.float64)
+        total_keywords = len(keywords)
+        for keyword in keywords:
+            column = self.column_of.get(keyword)
+            if column is None:
+                raise KeyError(f"Keyword '{keyword}' is not in the precomputed vocabulary")
+            scores += self.weights[:, column] / total_keywords
+        return scores
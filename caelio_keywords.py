@@ -0,0 +1,109 @@
+"""
+Bộ keyword dùng để match sách theo nhóm tính cách và lĩnh vực chuyên ngành
+Dùng chung giữa API (chấm điểm) và catalog (tính sẵn ma trận keyword)
+"""
+
+from typing import List
+
+# 5 nhóm tính cách chính (cùng thứ tự với CaelioPersonalitySystem.groups)
+PERSONALITY_GROUPS = ['Kết nối', 'Tự do', 'Tri thức', 'Chinh phục', 'Kiến tạo']
+
+# Keywords theo lĩnh vực chuyên ngành (hành trình chuyên ngành)
+FIELD_KEYWORDS = {
+    'business': ['kinh doanh', 'marketing', 'bán hàng', 'quản trị', 'tài chính', 'kế toán', 'chứng khoán', 'đầu tư', 'khởi nghiệp'],
+    'humanities': ['văn học', 'lịch sử', 'triết học', 'xã hội', 'nhân văn', 'tôn giáo', 'văn hóa'],
+    'science': ['khoa học', 'toán học', 'vật lý', 'hóa học', 'sinh học', 'địa lý', 'kỹ thuật'],
+    'technology': ['công nghệ', 'tin học', 'lập trình', 'máy tính', 'internet', 'ai', 'robot'],
+    'medical': ['y học', 'sức khỏe', 'dược', 'y khoa', 'chăm sóc', 'dinh dưỡng'],
+    'education': ['giáo dục', 'sư phạm', 'dạy học', 'đào tạo', 'trẻ em'],
+    'arts': ['nghệ thuật', 'hội họa', 'thiết kế', 'kiến trúc', 'âm nhạc', 'múa', 'thời trang'],
+    'agriculture': ['nông nghiệp', 'lâm nghiệp', 'thủy sản', 'trồng trọt', 'chăn nuôi']
+}
+
+
+def get_personality_keywords_for_matching(primary_group: str, is_synthesizer: bool) -> List[str]:
+    """Lấy keywords để match sách theo personality group"""
+    base_keywords = {
+        'Kết nối': [
+            # Tâm lý - cảm xúc
+            'tâm lý', 'cảm xúc', 'tình yêu', 'gia đình', 'mối quan hệ', 'kết nối', 'giao tiếp',
+            'đồng cảm', 'chia sẻ', 'yêu thương', 'chăm sóc', 'hỗ trợ', 'giúp đỡ',
+            # Văn học cảm xúc
+            'tiểu thuyết', 'tản văn', 'hồi ký', 'nhật ký', 'thư từ', 'truyện ngắn',
+            'văn học', 'tình cảm', 'lãng mạn', 'gia đình', 'tuổi thơ', 'kỷ niệm',
+            # Phát triển bản thân - mối quan hệ
+            'phát triển bản thân', 'kỹ năng mềm', 'lãnh đạo', 'teamwork', 'hợp tác',
+            'xây dựng', 'nuôi dưỡng', 'giáo dục', 'con trẻ', 'parenting'
+        ],
+        'Tự do': [
+            # Du lịch - khám phá
+            'du lịch', 'khám phá', 'phiêu lưu', 'xê dịch', 'văn hóa', 'thế giới',
+            'tự do', 'độc lập', 'cá nhân', 'bản sắc', 'cá tính', 'phong cách',
+            # Nghệ thuật - sáng tạo  
+            'nghệ thuật', 'sáng tạo', 'thiết kế', 'hội họa', 'nhiếp ảnh', 'âm nhạc',
+            'thời trang', 'làm đẹp', 'phong cách sống', 'lifestyle', 'trang trí',
+            # Tư duy độc lập
+            'tư duy', 'suy nghĩ', 'quan điểm', 'góc nhìn', 'phản biện', 'độc đáo',
+            'khác biệt', 'đổi mới', 'sáng kiến', 'breakthrough', 'innovation'
+        ],
+        'Tri thức': [
+            # Khoa học - nghiên cứu
+            'khoa học', 'nghiên cứu', 'lý thuyết', 'phương pháp', 'phân tích', 'logic',
+            'toán học', 'vật lý', 'hóa học', 'sinh học', 'địa lý', 'thiên văn',
+            'công nghệ', 'kỹ thuật', 'máy tính', 'lập trình', 'ai', 'robotics',
+            # Lịch sử - triết học
+            'lịch sử', 'triết học', 'tôn giáo', 'văn minh', 'nhân loại', 'xã hội',
+            'chính trị', 'kinh tế học', 'tâm lý học', 'xã hội học', 'nhân học',
+            # Học thuật
+            'giáo trình', 'học thuật', 'nghiên cứu', 'luận văn', 'bài báo', 'chuyên ngành',
+            'đại học', 'cao học', 'tiến sĩ', 'giáo sư', 'chuyên gia', 'expert'
+        ],
+        'Chinh phục': [
+            # Thành công - lãnh đạo
+            'thành công', 'chiến thắng', 'đạt được', 'mục tiêu', 'kết quả', 'hiệu quả',
+            'lãnh đạo', 'quản lý', 'điều hành', 'chỉ đạo', 'dẫn dắt', 'leadership',
+            'CEO', 'giám đốc', 'sếp', 'quản lý', 'teamlead', 'manager',
+            # Thách thức - cạnh tranh
+            'thách thức', 'cạnh tranh', 'đối đầu', 'vượt qua', 'chinh phục', 'đột phá',
+            'chiến lược', 'tactic', 'kế hoạch', 'planning', 'strategy', 'execution',
+            # Truyền cảm hứng
+            'truyền cảm hứng', 'động lực', 'motivation', 'inspiring', 'passionate',
+            'quyết tâm', 'ý chí', 'bền bỉ', 'kiên trì', 'vượt khó', 'overcome'
+        ],
+        'Kiến tạo': [
+            # Kinh doanh - khởi nghiệp
+            'kinh doanh', 'khởi nghiệp', 'startup', 'doanh nghiệp', 'công ty', 'business',
+            'marketing', 'bán hàng', 'sales', 'customer', 'khách hàng', 'thị trường',
+            'đầu tư', 'tài chính', 'ngân hàng', 'chứng khoán', 'real estate', 'bất động sản',
+            # Kỹ năng thực tế
+            'kỹ năng', 'thực hành', 'ứng dụng', 'practical', 'hands-on', 'tutorial',
+            'hướng dẫn', 'cẩm nang', 'manual', 'guide', 'how-to', 'step-by-step',
+            # Xây dựng - phát triển
+            'xây dựng', 'phát triển', 'tăng trưởng', 'growth', 'scale', 'expansion',
+            'hệ thống', 'quy trình', 'process', 'system', 'framework', 'methodology'
+        ]
+    }
+    
+    keywords = base_keywords.get(primary_group, [])
+    
+    # Nếu là synthesizer, thêm keywords liên ngành
+    if is_synthesizer:
+        synthesizer_keywords = [
+            'liên ngành', 'đa ngành', 'tổng hợp', 'kết hợp', 'tích hợp', 'interdisciplinary',
+            'multidisciplinary', 'cross-functional', 'holistic', 'comprehensive',
+            'tư duy hệ thống', 'systems thinking', 'big picture', 'toàn cảnh',
+            'liên kết', 'kết nối', 'integration', 'synthesis', 'convergence'
+        ]
+        keywords.extend(synthesizer_keywords)
+    
+    return keywords
+
+
+def get_matching_vocabulary() -> List[str]:
+    """Tất cả keyword có thể được dùng khi chấm điểm (không trùng lặp)"""
+    vocabulary = []
+    for group in PERSONALITY_GROUPS:
+        vocabulary.extend(get_personality_keywords_for_matching(group, True))
+    for keywords in FIELD_KEYWORDS.values():
+        vocabulary.extend(keywords)
+    return list(dict.fromkeys(vocabulary))
@@ -3,6 +3,12 @@ Hệ thống phân loại tính cách đọc sách Caelio
 Dựa trên tài liệu hướng dẫn chính thức
 """
 
+import itertools
+import numpy as np
+
+# Các câu WHY: đủ để tính profile sơ bộ, và dùng để phân định khi hai nhóm đầu bằng điểm
+WHY_QUESTIONS = ('Q1', 'Q2', 'Q3')
+
 class CaelioPersonalitySystem:
     def __init__(self):
         # 5 nhóm tính cách chính + 1 nhóm ẩn
@@ -134,6 +140,62 @@ class CaelioPersonalitySystem:
                 }
             }
         }
+        
+        # Profile sơ bộ cho mọi tổ hợp Q1-Q3 (5×5×5), tra một lần khi chỉ có 3 câu
+        self.partial_profiles = self._build_partial_profiles()
+        self._full_profile_distributions = {}
+        
+        # Bảng tra lựa chọn → nhóm / Synthesizer cho tính profile theo lô (NumPy)
+        self.group_names = list(self.groups)
+        self._build_choice_lookup()
+
+    def _build_partial_profiles(self):
+        """Tính sẵn profile sơ bộ cho mọi tổ hợp câu trả lời Q1-Q3"""
+        choices = [self.discovery_questions[q_id]['choices'] for q_id in WHY_QUESTIONS]
+        return {
+            combo: self.calculate_discovery_profile(dict(zip(WHY_QUESTIONS, combo)))
+            for combo in itertools.product(*choices)
+        }
+
+    def _why_key(self, answers):
+        if set(answers) != set(WHY_QUESTIONS):
+            raise ValueError("Partial profile requires answers to exactly Q1, Q2 and Q3")
+        key = tuple(answers[q_id] for q_id in WHY_QUESTIONS)
+        if key not in self.partial_profiles:
+            raise ValueError(f"Invalid WHY answers: {dict(zip(WHY_QUESTIONS, key))}")
+        return key
+
+    def calculate_partial_profile(self, answers):
+        """Profile sơ bộ từ 3 câu WHY (Q1-Q3), tra từ bảng tính sẵn
+
+        Giống calculate_discovery_profile trên 3 câu đó.
+        """
+        profile = self.partial_profiles[self._why_key(answers)]
+        return {**profile, 'all_scores': dict(profile['all_scores'])}
+
+    def full_profile_distribution(self, answers):
+        """Phân bố profile đầy đủ từ 3 câu WHY khi Q4-Q8 được chọn ngẫu nhiên đều
+
+        Trả về {profile_name: xác suất}, giảm dần. Tính một lần cho mỗi tổ hợp Q1-Q3.
+        """
+        key = self._why_key(answers)
+        distribution = self._full_profile_distributions.get(key)
+        if distribution is None:
+            how_questions = [q_id for q_id in self.discovery_questions if q_id not in WHY_QUESTIONS]
+            counts = {}
+            completions = itertools.product(*(self.discovery_questions[q_id]['choices'] for q_id in how_questions))
+            total = 0
+            for completion in completions:
+                full_answers = dict(zip(WHY_QUESTIONS, key), **dict(zip(how_questions, completion)))
+                profile_name = self.calculate_discovery_profile(full_answers)['profile_name']
+                counts[profile_name] = counts.get(profile_name, 0) + 1
+                total += 1
+            distribution = {
+                name: count / total
+                for name, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+            }
+            self._full_profile_distributions[key] = distribution
+        return dict(distribution)
 
     def calculate_discovery_profile(self, answers):
         """Tính toán profile cho hành trình KHÁM PHÁ"""
@@ -234,6 +296,103 @@ class CaelioPersonalitySystem:
             'is_multi_motivated': abs(primary_score - secondary_score) <= 1
         }
 
+    def _build_choice_lookup(self):
+        """Mảng (số câu × số lựa chọn tối đa): mã nhóm của lựa chọn (-1 nếu không thuộc nhóm nào) và cờ Synthesizer"""
+        self.discovery_question_ids = list(self.discovery_questions)
+        self.discovery_choice_codes = [list(question['choices']) for question in self.discovery_questions.values()]
+        width = max(len(codes) for codes in self.discovery_choice_codes)
+        
+        self.choice_group_lookup = np.full((len(self.discovery_question_ids), width), -1, dtype=np.int8)
+        self.choice_synthesizer_lookup = np.zeros((len(self.discovery_question_ids), width), dtype=np.int8)
+        self.choice_counts = np.array([len(codes) for codes in self.discovery_choice_codes])
+        group_index = {group: index for index, group in enumerate(self.group_names)}
+        for q_index, question in enumerate(self.discovery_questions.values()):
+            for c_index, choice_data in enumerate(question['choices'].values()):
+                self.choice_group_lookup[q_index, c_index] = group_index.get(choice_data['group'], -1)
+                self.choice_synthesizer_lookup[q_index, c_index] = bool(choice_data.get('synthesizer', False))
+
+    def encode_discovery_answers(self, answer_sets):
+        """List dict câu trả lời 8 câu → mảng mã lựa chọn (N × 8), mã là vị trí của lựa chọn trong câu hỏi (A=0)"""
+        codes = np.zeros((len(answer_sets), len(self.discovery_question_ids)), dtype=np.uint8)
+        for q_index, q_id in enumerate(self.discovery_question_ids):
+            choice_index = {choice: index for index, choice in enumerate(self.discovery_choice_codes[q_index])}
+            try:
+                codes[:, q_index] = [choice_index[answers[q_id]] for answers in answer_sets]
+            except KeyError as e:
+                raise ValueError(f"Missing or invalid answer for question {q_id}: {e}")
+        return codes
+
+    def calculate_discovery_profiles_batch(self, codes):
+        """Tính profile khám phá cho N bộ 8 câu trả lời cùng lúc
+
+        codes: mảng (N × 8) mã lựa chọn (xem encode_discovery_answers). Trả về dict mảng
+        độ dài N: mã nhóm (vị trí trong group_names) cho primary_group/secondary_group,
+        điểm, cờ Synthesizer và all_scores (N × số nhóm). Kết quả giống hệt
+        calculate_discovery_profile từng dòng, kể cả thứ tự khi hòa điểm và luật WHY.
+        """
+        codes = np.asarray(codes)
+        n_questions = len(self.discovery_question_ids)
+        if codes.ndim != 2 or codes.shape[1] != n_questions:
+            raise ValueError(f"codes must have shape (N, {n_questions})")
+        if len(codes) and (codes.min() < 0 or (codes.max(axis=0) >= self.choice_counts).any()):
+            raise ValueError("codes contain an invalid choice")
+        
+        question_index = np.arange(n_questions)
+        groups = self.choice_group_lookup[question_index, codes]
+        synthesizer_score = self.choice_synthesizer_lookup[question_index, codes].sum(axis=1, dtype=np.int8)
+        
+        n_groups = len(self.group_names)
+        all_scores = np.empty((len(codes), n_groups), dtype=np.int8)
+        for group in range(n_groups):
+            all_scores[:, group] = (groups == group).sum(axis=1, dtype=np.int8)
+        
+        # sorted(..., reverse=True) giữ thứ tự nhóm khi bằng điểm: primary là nhóm
+        # điểm cao nhất đứng đầu, secondary là nhóm cao nhất đứng đầu trong phần còn lại
+        rows = np.arange(len(codes))
+        primary = all_scores.argmax(axis=1).astype(np.int8)
+        remaining = all_scores.copy()
+        remaining[rows, primary] = -1
+        secondary = remaining.argmax(axis=1).astype(np.int8)
+        primary_score = all_scores[rows, primary]
+        secondary_score = all_scores[rows, secondary]
+        
+        # Hòa điểm: đổi chỗ nếu nhóm thứ hai xuất hiện nhiều hơn trong phần WHY
+        why_groups = groups[:, [self.discovery_question_ids.index(q_id) for q_id in WHY_QUESTIONS]]
+        why_primary = (why_groups == primary[:, None]).sum(axis=1)
+        why_secondary = (why_groups == secondary[:, None]).sum(axis=1)
+        swap = (primary_score == secondary_score) & (why_secondary > why_primary)
+        primary, secondary = np.where(swap, secondary, primary), np.where(swap, primary, secondary)
+        
+        is_multi_motivated = (primary_score - secondary_score) <= 1
+        return {
+            'primary_group': primary,
+            'secondary_group': secondary,
+            'primary_score': primary_score,
+            'secondary_score': secondary_score,
+            'synthesizer_score': synthesizer_score,
+            'is_synthesizer': (synthesizer_score >= 3) & is_multi_motivated,
+            'is_multi_motivated': is_multi_motivated,
+            'all_scores': all_scores
+        }
+
+    def profile_from_batch(self, batch, index):
+        """Dict profile (như calculate_discovery_profile) cho dòng `index` của kết quả theo lô"""
+        primary_group = self.group_names[batch['primary_group'][index]]
+        is_synthesizer = bool(batch['is_synthesizer'][index])
+        suffix = "–Synthesizer" if is_synthesizer else ""
+        return {
+            'primary_group': primary_group,
+            'secondary_group': self.group_names[batch['secondary_group'][index]],
+            'primary_score': int(batch['primary_score'][index]),
+            'secondary_score': int(batch['secondary_score'][index]),
+            'synthesizer_score': int(batch['synthesizer_score'][index]),
+            'is_synthesizer': is_synthesizer,
+            'profile_name': primary_group + suffix,
+            'english_name': self.groups[primary_group] + suffix,
+            'all_scores': dict(zip(self.group_names, batch['all_scores'][index].tolist())),
+            'is_multi_motivated': bool(batch['is_multi_motivated'][index])
+        }
+
     def get_book_recommendations(self, profile):
         """Đưa ra gợi ý sách dựa trên profile"""
         recommendations = {
@@ -0,0 +1,265 @@
+"""
+Xếp hạng sách cho các endpoint gợi ý của Caelio API
+Điểm = điểm keyword (ma trận tính sẵn) + bonus bán chạy (+ bonus rating/review)
+
+RecommendationEngine chạy một pipeline các stage:
+    KeywordStage -> PopularityBoostStage -> QualityBoostStage -> ThresholdStage -> TopKStage
+/recommend, /discover và /professional đều dùng chung engine của catalog.
+
+Benchmark:
+    python caelio_recommender.py [books.csv]
+"""
+
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from caelio_keywords import FIELD_KEYWORDS, PERSONALITY_GROUPS, get_personality_keywords_for_matching
+
+# Ngưỡng điểm tối thiểu để sách được đưa vào kết quả
+SCORE_THRESHOLD = 0.05
+
+# Số sách đầu bảng được giữ trong cache xếp hạng của catalog; top_n lớn hơn thì tính riêng
+RANKING_CACHE_DEPTH = int(os.environ.get('CAELIO_RANKING_CACHE_DEPTH', '500'))
+
+
+class RankedBooks(NamedTuple):
+    """Kết quả xếp hạng: vị trí dòng trong catalog và điểm tương ứng, giảm dần
+
+    positions/scores có thể chỉ là phần đầu bảng (top-k); total_matches luôn là
+    tổng số sách vượt ngưỡng.
+    """
+    positions: np.ndarray
+    scores: np.ndarray
+    total_matches: int
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.positions) == self.total_matches
+
+
+class RankingRequest(NamedTuple):
+    """Tham số của một lần xếp hạng"""
+    keywords: List[str]
+    include_quality_boost: bool = True
+    top_k: Optional[int] = None
+
+
+def numeric_column(book_df, column):
+    """Cột số dạng mảng float64, giá trị thiếu (hoặc thiếu cột) thành 0"""
+    if column not in book_df.columns:
+        return np.zeros(len(book_df), dtype=np.float64)
+    return book_df[column].fillna(0).to_numpy(dtype=np.float64)
+
+
+# === CÁC STAGE CỦA PIPELINE ===
+
+class KeywordStage:
+    """Điểm khớp keyword (ma trận sách × keyword tính sẵn)"""
+    name = 'keyword'
+
+    def score(self, engine, scores, request):
+        return scores + engine.keyword_matrix.match_scores(request.keywords)
+
+
+class PopularityBoostStage:
+    """Bonus for sales volume (quantity) - max 20% boost for high sales"""
+    name = 'popularity'
+
+    def score(self, engine, scores, request):
+        return scores + engine.popularity_boost
+
+
+class QualityBoostStage:
+    """Bonus for rating and reviews - max 10% each (hành trình chuyên ngành bỏ qua)
+
+    Cộng từng bonus lần lượt như công thức gốc (match + sales + rating + review)
+    để điểm giống từng bit và không đổi thứ tự các sách bằng điểm.
+    """
+    name = 'quality'
+
+    def score(self, engine, scores, request):
+        if not request.include_quality_boost:
+            return scores
+        scores = scores + engine.rating_boost
+        scores += engine.review_boost
+        return scores
+
+
+class ThresholdStage:
+    """Chỉ giữ sách có điểm > ngưỡng"""
+    name = 'threshold'
+
+    def __init__(self, threshold=SCORE_THRESHOLD):
+        self.threshold = threshold
+
+    def select(self, engine, scores, request):
+        return np.flatnonzero(scores > self.threshold)
+
+
+class TopKStage:
+    """Sắp xếp theo điểm rồi số lượng bán (giảm dần, giữ thứ tự gốc khi hòa)
+
+    Có top_k thì chỉ giữ sách có điểm >= điểm lớn thứ k (gồm mọi sách hòa
+    điểm ở biên) trước khi sắp xếp, nên kết quả đúng bằng phần đầu của thứ
+    tự đầy đủ.
+    """
+    name = 'top_k'
+
+    def rank(self, engine, scores, matched, request):
+        top_k = request.top_k
+        if top_k is not None and top_k < 0:
+            top_k = None
+
+        candidates = matched
+        if top_k is not None and top_k < len(matched):
+            matched_scores = scores[matched]
+            if top_k == 0:
+                candidates = matched[:0]
+            else:
+                kth_score = np.partition(matched_scores, len(matched) - top_k)[len(matched) - top_k]
+                candidates = matched[matched_scores >= kth_score]
+
+        order = np.lexsort((-engine.quantity[candidates], -scores[candidates]))
+        positions = candidates[order][:top_k]
+        return RankedBooks(positions, scores[positions], len(matched))
+
+
+def default_stages():
+    """Pipeline mặc định, giống công thức chấm điểm gốc của API"""
+    return [KeywordStage(), PopularityBoostStage(), QualityBoostStage(), ThresholdStage(), TopKStage()]
+
+
+# === ENGINE ===
+
+def recommendation_keywords(primary_group: str, is_synthesizer: bool, field: Optional[str] = None) -> List[str]:
+    """Keywords cho một profile; có field thì thêm keywords chuyên ngành"""
+    keywords = get_personality_keywords_for_matching(primary_group, is_synthesizer)
+    if field is not None:
+        keywords = keywords + FIELD_KEYWORDS.get(field, [])
+    return keywords
+
+
+class RecommendationEngine:
+    """Xếp hạng sách cho mọi endpoint gợi ý
+
+    Giữ các mảng tính sẵn của catalog (ma trận keyword, bonus bán chạy/rating/
+    review, mã category) và cache xếp hạng theo profile. Pipeline gồm các stage
+    chấm điểm (có `score`), một stage lọc (có `select`) và một stage xếp hạng
+    (có `rank`); có thể thay stage để thử công thức khác.
+    """
+
+    def __init__(self, book_df, keyword_matrix, stages=None, cache_depth=None):
+        self.keyword_matrix = keyword_matrix
+        self.stages = stages if stages is not None else default_stages()
+        self.cache_depth = RANKING_CACHE_DEPTH if cache_depth is None else cache_depth
+
+        self.quantity = numeric_column(book_df, 'quantity')
+        self.popularity_boost = np.minimum(self.quantity / 10000, 1.0) * 0.2
+        avg_rating = numeric_column(book_df, 'avg_rating')
+        n_review = np.trunc(numeric_column(book_df, 'n_review'))
+        self.rating_boost = np.where(avg_rating > 0, (avg_rating / 5.0) * 0.1, 0)
+        self.review_boost = np.where(n_review > 0, np.minimum(n_review / 1000, 1.0) * 0.1, 0)
+
+        self.rankings = self.build_ranking_cache()
+
+    def rank(self, keywords: List[str], include_quality_boost: bool = True,
+             top_k: Optional[int] = None) -> RankedBooks:
+        """Chạy pipeline cho một danh sách keyword"""
+        request = RankingRequest(keywords, include_quality_boost, top_k)
+        scores = np.zeros(len(self.quantity), dtype=np.float64)
+        matched = None
+        for stage in self.stages:
+            if hasattr(stage, 'score'):
+                scores = stage.score(self, scores, request)
+            elif hasattr(stage, 'select'):
+                matched = stage.select(self, scores, request)
+            else:
+                if matched is None:
+                    matched = np.arange(len(scores))
+                return stage.rank(self, scores, matched, request)
+        raise ValueError("Recommendation pipeline has no ranking stage")
+
+    def compute_ranking(self, primary_group: str, is_synthesizer: bool, field: Optional[str] = None,
+                        top_k: Optional[int] = None) -> RankedBooks:
+        """Xếp hạng cho một profile (hành trình chuyên ngành không cộng bonus rating/review)"""
+        keywords = recommendation_keywords(primary_group, is_synthesizer, field)
+        return self.rank(keywords, include_quality_boost=field is None, top_k=top_k)
+
+    def build_ranking_cache(self):
+        """Tính sẵn bảng xếp hạng cho mọi (nhóm, synthesizer[, field]) có thể gặp
+
+        Không gian profile rất nhỏ (5 nhóm × 2 × (1 + 8 field)) nên tính hết khi
+        load catalog; reload catalog thì engine mới được dựng cùng catalog mới.
+        Mỗi bảng chỉ giữ cache_depth sách đầu cùng tổng số sách khớp.
+        """
+        rankings = {}
+        for primary_group in PERSONALITY_GROUPS:
+            for is_synthesizer in (False, True):
+                for field in [None] + list(FIELD_KEYWORDS):
+                    key = (primary_group, is_synthesizer, field)
+                    rankings[key] = self.compute_ranking(*key, top_k=self.cache_depth)
+        return rankings
+
+    def get_ranking(self, primary_group: str, is_synthesizer: bool, field: Optional[str] = None,
+                    top_n: Optional[int] = None) -> RankedBooks:
+        """Lấy bảng xếp hạng đã tính sẵn (đủ cho top_n sách đầu)
+
+        Profile nằm ngoài cache hoặc top_n sâu hơn phần đã cache thì tính riêng
+        cho request này; top_n âm (cắt từ cuối danh sách) cần bảng đầy đủ.
+        """
+        key = (primary_group, bool(is_synthesizer), field)
+        ranked = self.rankings.get(key)
+        if ranked is None:
+            ranked = self.compute_ranking(*key, top_k=self.cache_depth)
+            self.rankings[key] = ranked
+
+        if ranked.is_complete or (top_n is not None and 0 <= top_n <= len(ranked.positions)):
+            return ranked
+        return self.compute_ranking(*key, top_k=top_n if top_n is not None and top_n >= 0 else None)
+
+
+def category_distribution(catalog, positions) -> Dict[str, int]:
+    """Số sách theo category trong `positions`, theo thứ tự category xuất hiện đầu tiên"""
+    codes = catalog.category_codes[positions]
+    unique_codes, first_seen, counts = np.unique(codes, return_index=True, return_counts=True)
+    distribution = {}
+    for index in np.argsort(first_seen, kind='stable'):
+        label = catalog.category_labels[unique_codes[index]]
+        distribution[label] = distribution.get(label, 0) + int(counts[index])
+    return distribution
+
+
+# === BENCHMARK ===
+
+def benchmark(catalog, repeat=20):
+    """Đo thời gian các bước của engine trên một catalog"""
+    engine = catalog.engine
+    keywords = recommendation_keywords('Tri thức', True)
+
+    def best_of(run, times=repeat):
+        timings = []
+        for _ in range(times):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    results = {
+        'keyword_stage': best_of(lambda: engine.keyword_matrix.match_scores(keywords)),
+        'rank_full': best_of(lambda: engine.rank(keywords)),
+        'rank_top_20': best_of(lambda: engine.rank(keywords, top_k=20)),
+        'ranking_cache_build': best_of(engine.build_ranking_cache, times=3),
+        'cached_ranking': best_of(lambda: engine.get_ranking('Tri thức', True, top_n=20)),
+    }
+    print(f"📊 RecommendationEngine on {len(catalog)} books:")
+    for name, seconds in results.items():
+        print(f"   {name:<20} {seconds * 1000:8.3f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    from caelio_catalog import load_catalog
+
+    benchmark(load_catalog(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,129 @@
+"""
+Bản ghi sách gọn (__slots__) dùng trong các endpoint
+Xử lý NaN/kiểu dữ liệu một lần khi load catalog thay vì mỗi lần tạo response
+"""
+
+import json
+import pandas as pd
+
+# Cột chuỗi: giá trị thiếu thành '' (giống safe_string_value)
+STRING_FIELDS = ['product_id', 'title', 'authors', 'category', 'manufacturer', 'cover_link']
+
+# Cột số: giá trị thiếu thành None, còn lại ép về float hoặc int
+FLOAT_FIELDS = ['original_price', 'current_price', 'quantity', 'avg_rating']
+INT_FIELDS = ['n_review', 'pages']
+
+
+class BookRecord:
+    """Một cuốn sách với các trường đã chuẩn hóa sẵn cho response
+
+    summary và content_preview được đọc lazy từ TextColumn của catalog.
+    """
+
+    __slots__ = ('position', *STRING_FIELDS, *FLOAT_FIELDS, *INT_FIELDS, '_text_columns')
+
+    def __init__(self, position, text_columns, **fields):
+        self.position = position
+        self._text_columns = text_columns
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def _text(self, column):
+        text_column = self._text_columns.get(column)
+        value = text_column[self.position] if text_column is not None else None
+        return value if value is not None else ''
+
+    @property
+    def summary(self):
+        return self._text('summary')
+
+    @property
+    def content_preview(self):
+        return self._text('content_preview')
+
+    def __repr__(self):
+        return f"BookRecord(position={self.position}, product_id={self.product_id!r}, title={self.title!r})"
+
+
+def _string_values(book_df, column):
+    if column not in book_df.columns:
+        return [''] * len(book_df)
+    return ['' if pd.isna(value) else str(value) for value in book_df[column].tolist()]
+
+
+def _numeric_values(book_df, column, cast):
+    if column not in book_df.columns:
+        return [None] * len(book_df)
+    return [None if pd.isna(value) else cast(value) for value in book_df[column].tolist()]
+
+
+def build_book_records(book_df, text_columns):
+    """Tạo BookRecord cho mọi dòng của DataFrame (đã qua prepare_book_frame)"""
+    columns = {name: _string_values(book_df, name) for name in STRING_FIELDS}
+    columns.update({name: _numeric_values(book_df, name, float) for name in FLOAT_FIELDS})
+    columns.update({name: _numeric_values(book_df, name, int) for name in INT_FIELDS})
+
+    names = list(columns)
+    return [
+        BookRecord(position, text_columns, **dict(zip(names, values)))
+        for position, values in enumerate(zip(*columns.values()))
+    ]
+
+
+def render_json(value):
+    """JSON bytes giống hệt JSONResponse của FastAPI (UTF-8, không khoảng trắng)"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+class BookFragments:
+    """JSON dựng sẵn cho từng sách, theo đúng thứ tự field của BookListItem / BookRecommendation
+
+    Fragment được render lần đầu sách xuất hiện trong một response rồi giữ lại
+    tới khi catalog reload; response chỉ còn là phép nối bytes với điểm của request.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self._list_items = [None] * len(records)
+        self._recommendations = [None] * len(records)
+
+    def list_item(self, position):
+        """JSON của BookListItem"""
+        fragment = self._list_items[position]
+        if fragment is None:
+            book = self.records[position]
+            fragment = render_json({
+                'product_id': book.product_id,
+                'title': book.title,
+                'authors': book.authors,
+                'original_price': book.original_price,
+                'current_price': book.current_price,
+                'category': book.category,
+                'n_review': book.n_review,
+                'avg_rating': book.avg_rating,
+                'pages': book.pages,
+                'manufacturer': book.manufacturer,
+                'cover_link': book.cover_link,
+                'summary': book.summary
+            })
+            self._list_items[position] = fragment
+        return fragment
+
+    def recommendation(self, position, score):
+        """JSON của BookRecommendation với personality_match_score = score"""
+        parts = self._recommendations[position]
+        if parts is None:
+            book = self.records[position]
+            head = render_json({
+                'product_id': book.product_id,
+                'title': book.title,
+                'authors': book.authors,
+                'category': book.category,
+                'summary': book.summary
+            })
+            parts = (
+                head[:-1] + b',"personality_match_score":',
+                b',"cover_link":' + render_json(book.cover_link) + b'}'
+            )
+            self._recommendations[position] = parts
+        return parts[0] + render_json(float(score)) + parts[1]
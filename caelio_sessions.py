@@ -0,0 +1,245 @@
+"""
+Phiên làm bài khám phá phía server cho Caelio API
+Mỗi câu trả lời chỉ cập nhật bộ đếm điểm nhóm/Synthesizer (O(1)), profile tạm
+thời được tính lại từ bộ đếm sau mỗi bước. Phiên được giữ trong bộ nhớ có giới
+hạn số lượng và hết hạn sau một khoảng không hoạt động (TTL).
+
+Khi phiên chỉ còn một câu chưa trả lời, kết quả gợi ý cho từng lựa chọn có thể
+của câu đó được tính trước (prefetch) để lần lấy gợi ý cuối trả về ngay.
+"""
+
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from caelio_personality_system import WHY_QUESTIONS
+
+# Thời gian (giây) một phiên không hoạt động trước khi bị xóa
+SESSION_TTL = float(os.environ.get('CAELIO_SESSION_TTL', '1800'))
+
+# Số phiên tối đa giữ trong bộ nhớ; vượt quá thì xóa phiên lâu không dùng nhất
+MAX_SESSIONS = int(os.environ.get('CAELIO_SESSION_MAX', '10000'))
+
+# Số sách của kết quả gợi ý được tính trước cho câu cuối (top_n khác thì tính khi được hỏi)
+PREFETCH_TOP_N = int(os.environ.get('CAELIO_PREFETCH_TOP_N', '20'))
+
+
+class QuizSession:
+    """Trạng thái một phiên làm bài: câu trả lời và bộ đếm điểm theo nhóm"""
+
+    def __init__(self, session_id, personality_system):
+        self.session_id = session_id
+        self.personality_system = personality_system
+        self.questions = personality_system.discovery_questions
+        self.answers = {}
+        self.scores = {group: 0 for group in personality_system.groups}
+        self.synthesizer_score = 0
+        self.prefetch = None
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+
+    def _apply(self, q_id, choice, delta):
+        choice_data = self.questions[q_id]['choices'][choice]
+        if choice_data['group'] in self.scores:
+            self.scores[choice_data['group']] += delta
+        if choice_data.get('synthesizer', False):
+            self.synthesizer_score += delta
+
+    def _profile_from(self, scores, synthesizer_score, answers):
+        why_answers = {q_id: answers[q_id] for q_id in WHY_QUESTIONS if q_id in answers}
+        return self.personality_system._determine_profile(dict(scores), synthesizer_score, why_answers)
+
+    def answer(self, q_id, choice):
+        """Ghi (hoặc sửa) câu trả lời cho một câu hỏi; chỉ cập nhật bộ đếm của câu đó"""
+        previous = self.answers.get(q_id)
+        if previous is not None:
+            self._apply(q_id, previous, -1)
+        self._apply(q_id, choice, 1)
+        self.answers[q_id] = choice
+
+    @property
+    def next_question(self):
+        """Câu hỏi đầu tiên chưa trả lời (theo thứ tự câu hỏi), None nếu đã xong"""
+        for q_id in self.questions:
+            if q_id not in self.answers:
+                return q_id
+        return None
+
+    @property
+    def is_complete(self):
+        return len(self.answers) == len(self.questions)
+
+    def profile(self):
+        """Profile tạm thời từ bộ đếm hiện tại (giống calculate_discovery_profile trên các câu đã trả lời)"""
+        if not self.answers:
+            return None
+        return self._profile_from(self.scores, self.synthesizer_score, self.answers)
+
+    def final_choice_profiles(self):
+        """Khi còn đúng một câu chưa trả lời: (câu đó, {lựa chọn: profile nếu chọn nó})
+
+        Trả về (None, {}) ở các trạng thái khác. Không thay đổi phiên.
+        """
+        q_id = self.next_question
+        if q_id is None or len(self.answers) != len(self.questions) - 1:
+            return None, {}
+        profiles = {}
+        for choice, choice_data in self.questions[q_id]['choices'].items():
+            scores = dict(self.scores)
+            if choice_data['group'] in scores:
+                scores[choice_data['group']] += 1
+            synthesizer_score = self.synthesizer_score + (1 if choice_data.get('synthesizer', False) else 0)
+            profiles[choice] = self._profile_from(scores, synthesizer_score, dict(self.answers, **{q_id: choice}))
+        return q_id, profiles
+
+
+class FinalAnswerPrefetch:
+    """Kết quả gợi ý tính trước cho từng lựa chọn của câu cuối
+
+    Chỉ dùng được khi các câu còn lại vẫn đúng như lúc tính (`base_answers`),
+    cùng top_n và cùng catalog (catalog reload thì bỏ). Chỉ giữ weakref tới catalog
+    để phiên không giữ catalog cũ sống tới hết TTL sau khi reload.
+    """
+
+    def __init__(self, question, base_answers, top_n, catalog, bodies, seconds):
+        self.question = question
+        self.base_answers = base_answers
+        self.top_n = top_n
+        self.catalog_ref = weakref.ref(catalog)
+        self.bodies = bodies
+        self.seconds = seconds
+        self.used = False
+
+    def lookup(self, answers, top_n, catalog):
+        """Body đã tính cho bộ câu trả lời đầy đủ `answers`, None nếu không khớp"""
+        if top_n != self.top_n or catalog is not self.catalog_ref():
+            return None
+        answers = dict(answers)
+        choice = answers.pop(self.question, None)
+        if answers != self.base_answers:
+            return None
+        return self.bodies.get(choice)
+
+
+class PrefetchStats:
+    """Đếm prefetch: số kết quả tính trước, số lần dùng được (hit) và phần công việc bỏ phí"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.skipped = 0
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+        self.used = 0
+        self.seconds = 0.0
+        self.used_seconds = 0.0
+
+    def record_run(self, prefetch):
+        with self._lock:
+            self.runs += 1
+            self.prefetched += len(prefetch.bodies)
+            self.seconds += prefetch.seconds
+
+    def record_skip(self):
+        """Ghi một lần bỏ prefetch vì pool và hàng chờ đang đầy"""
+        with self._lock:
+            self.skipped += 1
+
+    def record_lookup(self, prefetch, hit):
+        """Ghi một lần lấy gợi ý cuối; mỗi prefetch chỉ tính phần dùng được một lần"""
+        with self._lock:
+            if not hit:
+                self.misses += 1
+                return
+            self.hits += 1
+            if not prefetch.used:
+                prefetch.used = True
+                self.used += 1
+                self.used_seconds += prefetch.seconds / len(prefetch.bodies)
+
+    def stats(self):
+        """wasted/wasted_ms gồm cả các kết quả tính trước chưa được dùng tới"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'runs': self.runs,
+                'skipped': self.skipped,
+                'prefetched': self.prefetched,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'wasted': self.prefetched - self.used,
+                'prefetch_ms': round(self.seconds * 1000, 3),
+                'wasted_ms': round((self.seconds - self.used_seconds) * 1000, 3)
+            }
+
+
+class SessionStore:
+    """Kho phiên trong bộ nhớ: LRU theo lần truy cập cuối, hết hạn sau `ttl` giây không hoạt động
+
+    Phiên lâu không dùng luôn nằm đầu OrderedDict nên dọn phiên hết hạn chỉ cần
+    xem từ đầu. An toàn khi gọi từ nhiều thread.
+    """
+
+    def __init__(self, personality_system, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.personality_system = personality_system
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.prefetch_stats = PrefetchStats()
+
+    def _evict_expired(self, now):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def create(self):
+        """Tạo phiên mới"""
+        session = QuizSession(secrets.token_urlsafe(16), self.personality_system)
+        with self._lock:
+            self._evict_expired(session.last_access)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            self._sessions[session.session_id] = session
+            self.created += 1
+        return session
+
+    def get(self, session_id):
+        """Lấy phiên và gia hạn TTL; None nếu không có hoặc đã hết hạn"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        """Xóa phiên; trả về False nếu không có"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        return {
+            'active': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
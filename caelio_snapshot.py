@@ -0,0 +1,456 @@
+"""
+Snapshot dạng cột (NumPy) cho dữ liệu sách và bình luận
+Build một lần từ CSV, lúc khởi động chỉ memory-map file .npy thay vì parse CSV
+
+Cấu trúc thư mục snapshot:
+    manifest.json                   schema_version, file nguồn, danh sách cột, sha256 từng file
+    <bảng>.<cột>.npy                cột số (int64/float64/bool)
+    <bảng>.<cột>.utf8               cột chuỗi: các giá trị UTF-8 ngăn cách bởi byte 0
+    <bảng>.<cột>.offsets.npy        vị trí byte bắt đầu của từng giá trị (n + 1 phần tử, tính cả dấu ngăn)
+    <bảng>.<cột>.missing.npy        cờ giá trị thiếu (NaN trong CSV)
+    books.content_preview.*         100 từ đầu của content, tính sẵn lúc build (cùng định dạng cột chuỗi)
+    books.keyword_weights.npy       ma trận sách × keyword  } ghi lần đầu catalog load từ snapshot,
+    books.text_index.<lọc>.*.npy    posting list trigram    } các worker sau chỉ memory-map
+
+Cột văn bản dài (summary, content) có thể mở dạng TextColumn: chỉ memory-map,
+giá trị được giải mã khi thật sự cần.
+
+Cách dùng:
+    python caelio_snapshot.py build [books.csv] [comments.csv]
+    python caelio_snapshot.py verify
+    python caelio_snapshot.py benchmark
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Tăng khi đổi định dạng file; snapshot khác version sẽ bị bỏ qua và load lại từ CSV
+SCHEMA_VERSION = 2
+
+MANIFEST_FILE = 'manifest.json'
+
+# Tên thư mục snapshot, đặt cạnh file sách nguồn (ghi đè bằng CAELIO_SNAPSHOT_DIR)
+SNAPSHOT_DIR_NAME = 'catalog_snapshot'
+
+# Kiểm tra sha256 mọi file khi load (đọc toàn bộ dữ liệu nên mặc định tắt)
+VERIFY_ON_LOAD = os.environ.get('CAELIO_SNAPSHOT_VERIFY') == '1'
+
+NUMERIC_KINDS = 'biuf'
+
+# Dấu ngăn giữa các giá trị chuỗi: giải mã cả cột bằng một lần decode + split
+VALUE_SEPARATOR = b'\x00'
+
+# Số từ đầu tiên của content hiển thị ở trang chi tiết sách
+PREVIEW_WORDS = 100
+
+CONTENT_PREVIEW = 'content_preview'
+
+
+def file_signature(file_path):
+    """Chữ ký (mtime, size) của file, None nếu file không tồn tại"""
+    if not file_path:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def default_snapshot_dir(book_file):
+    """Thư mục snapshot ứng với file sách nguồn"""
+    configured = os.environ.get('CAELIO_SNAPSHOT_DIR')
+    if configured:
+        return configured
+    return os.path.join(os.path.dirname(os.path.abspath(book_file)), SNAPSHOT_DIR_NAME)
+
+
+def file_sha256(file_path):
+    """sha256 của file, đọc theo từng khối 1MB"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_text_values(values):
+    """Mã hóa dãy chuỗi thành (blob, offsets, missing); giá trị thiếu là chuỗi rỗng có cờ missing"""
+    missing = np.array([pd.isna(value) for value in values], dtype=bool)
+    encoded = [b'' if is_missing else str(value).encode('utf-8') for value, is_missing in zip(values, missing)]
+    if any(VALUE_SEPARATOR in value for value in encoded):
+        raise ValueError("Text values must not contain NUL bytes")
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) + 1 for value in encoded], out=offsets[1:])
+    return VALUE_SEPARATOR.join(encoded) + VALUE_SEPARATOR, offsets, missing
+
+
+def content_preview(text, words=PREVIEW_WORDS):
+    """`words` từ đầu tiên của text (None nếu thiếu)"""
+    if text is None or pd.isna(text):
+        return None
+    return ' '.join(str(text).split()[:words])
+
+
+class TextColumn:
+    """Cột chuỗi lưu dạng blob UTF-8 + offsets, giải mã từng giá trị khi truy cập
+
+    Blob có thể là bytes trong RAM hoặc memmap của file snapshot; với memmap,
+    văn bản chỉ được đọc vào bộ nhớ khi trang chi tiết hay bộ chấm điểm cần tới.
+    """
+
+    def __init__(self, blob, offsets, missing):
+        if len(offsets) != len(missing) + 1 or len(blob) != offsets[-1]:
+            raise ValueError("Text column blob does not match its offsets")
+        self.blob = blob
+        self.offsets = offsets
+        self.missing = missing
+        self.mapped = isinstance(blob, np.memmap)
+
+    @classmethod
+    def from_values(cls, values):
+        """Đóng gói dãy chuỗi trong RAM (ít tốn bộ nhớ hơn nhiều object str rời)"""
+        return cls(*encode_text_values(list(values)))
+
+    @classmethod
+    def open(cls, snapshot_dir, spec):
+        """Memory-map một cột chuỗi của snapshot"""
+        paths = [os.path.join(snapshot_dir, file_name) for file_name in spec['files']]
+        offsets = np.load(paths[1], mmap_mode='r')
+        missing = np.load(paths[2], mmap_mode='r')
+        blob = np.memmap(paths[0], dtype=np.uint8, mode='r') if offsets[-1] else b''
+        return cls(blob, offsets, missing)
+
+    def __len__(self):
+        return len(self.missing)
+
+    def __getitem__(self, position):
+        if self.missing[position]:
+            return None
+        return bytes(self.blob[self.offsets[position]:self.offsets[position + 1] - 1]).decode('utf-8')
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def decode_all(self):
+        """Toàn bộ cột dạng mảng object (NaN cho giá trị thiếu), một lần decode + split"""
+        values = np.empty(len(self), dtype=object)
+        if len(self):
+            values[:] = bytes(self.blob[:-1]).decode('utf-8').split(VALUE_SEPARATOR.decode())
+        values[np.asarray(self.missing)] = np.nan
+        return values
+
+    @property
+    def resident_bytes(self):
+        """Số byte giữ trong heap (cột memory-map không tính)"""
+        if self.mapped:
+            return 0
+        return len(self.blob) + self.offsets.nbytes + self.missing.nbytes
+
+
+def _write_text_column(snapshot_dir, prefix, values):
+    files = [f"{prefix}.utf8", f"{prefix}.offsets.npy", f"{prefix}.missing.npy"]
+    blob, offsets, missing = encode_text_values(values)
+    with open(os.path.join(snapshot_dir, files[0]), 'wb') as f:
+        f.write(blob)
+    np.save(os.path.join(snapshot_dir, files[1]), offsets, allow_pickle=False)
+    np.save(os.path.join(snapshot_dir, files[2]), missing, allow_pickle=False)
+    return {'kind': 'string', 'dtype': 'str', 'files': files}
+
+
+def _write_column(snapshot_dir, table, column, series):
+    """Ghi một cột, trả về mô tả cột cho manifest"""
+    prefix = f"{table}.{column}"
+    if series.dtype.kind in NUMERIC_KINDS:
+        file_name = f"{prefix}.npy"
+        np.save(os.path.join(snapshot_dir, file_name), series.to_numpy(), allow_pickle=False)
+        return {'kind': 'numeric', 'dtype': str(series.dtype), 'files': [file_name]}
+
+    return _write_text_column(snapshot_dir, prefix, list(series))
+
+
+def build_snapshot(book_file, comments_file=None, snapshot_dir=None):
+    """Chuyển CSV sách (và bình luận) thành snapshot dạng cột, trả về manifest"""
+    snapshot_dir = snapshot_dir or default_snapshot_dir(book_file)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    sources = {'books': book_file}
+    if comments_file:
+        sources['comments'] = comments_file
+
+    manifest = {'schema_version': SCHEMA_VERSION, 'created_at': time.time(), 'sources': {}, 'tables': {}}
+    for table, source in sources.items():
+        # Chữ ký lấy trước khi đọc để thay đổi trong lúc build vẫn làm snapshot bị coi là cũ
+        signature = file_signature(source)
+        frame = pd.read_csv(source)
+        manifest['sources'][table] = {'path': os.path.abspath(source), 'signature': list(signature)}
+        manifest['tables'][table] = {
+            'rows': len(frame),
+            'columns': {column: _write_column(snapshot_dir, table, column, frame[column]) for column in frame.columns},
+            'derived': {}
+        }
+        if table == 'books' and 'content' in frame.columns:
+            previews = [content_preview(value) for value in frame['content']]
+            manifest['tables'][table]['derived'][CONTENT_PREVIEW] = _write_text_column(
+                snapshot_dir, f"{table}.{CONTENT_PREVIEW}", previews
+            )
+
+    manifest['checksums'] = {
+        file_name: file_sha256(os.path.join(snapshot_dir, file_name))
+        for table in manifest['tables'].values()
+        for column in [*table['columns'].values(), *table['derived'].values()]
+        for file_name in column['files']
+    }
+
+    # Ghi manifest sau cùng để không bao giờ có manifest trỏ tới file chưa ghi xong
+    write_manifest(snapshot_dir, manifest)
+    return manifest
+
+
+def write_manifest(snapshot_dir, manifest):
+    """Ghi manifest qua file tạm rồi đổi tên (nguyên tử, kể cả khi nhiều worker cùng ghi)"""
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def read_manifest(snapshot_dir):
+    """Đọc manifest, None nếu chưa có snapshot hoặc khác schema version"""
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('schema_version') != SCHEMA_VERSION:
+        return None
+    return manifest
+
+
+def is_snapshot_fresh(manifest, book_file, comments_file=None):
+    """Snapshot được build từ đúng các file này và các file chưa đổi từ lúc build"""
+    expected = {'books': book_file}
+    if comments_file:
+        expected['comments'] = comments_file
+    if set(manifest['sources']) != set(expected):
+        return False
+
+    for table, source in expected.items():
+        recorded = manifest['sources'][table]
+        if recorded['path'] != os.path.abspath(source):
+            return False
+        if list(file_signature(source) or []) != recorded['signature']:
+            return False
+    return True
+
+
+def save_derived_arrays(snapshot_dir, table, arrays, **meta):
+    """Thêm các mảng tính sẵn từ dữ liệu (ma trận keyword, index) vào snapshot đã build
+
+    `meta` được ghi vào manifest để lúc load kiểm tra mảng còn dùng được không.
+    Build lại snapshot sẽ bỏ các mảng này.
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+
+    for name, array in arrays.items():
+        file_name = f"{table}.{name}.npy"
+        file_path = os.path.join(snapshot_dir, file_name)
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(temp_path, file_path)
+
+        manifest['tables'][table]['derived'][name] = {
+            'kind': 'array', 'dtype': str(array.dtype), 'shape': list(array.shape), 'files': [file_name], **meta
+        }
+        manifest['checksums'][file_name] = file_sha256(file_path)
+    write_manifest(snapshot_dir, manifest)
+    return manifest
+
+
+def load_derived_arrays(snapshot_dir, table, names, **meta):
+    """Memory-map các mảng tính sẵn của snapshot; None nếu thiếu mảng nào hoặc `meta` không khớp"""
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or table not in manifest['tables']:
+        return None
+
+    derived = manifest['tables'][table]['derived']
+    arrays = {}
+    for name in names:
+        spec = derived.get(name)
+        if spec is None or spec['kind'] != 'array' or any(spec.get(key) != value for key, value in meta.items()):
+            return None
+        try:
+            arrays[name] = np.load(os.path.join(snapshot_dir, spec['files'][0]), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if list(arrays[name].shape) != spec['shape']:
+            return None
+    return arrays
+
+
+def verify_snapshot(snapshot_dir, manifest=None):
+    """Kiểm tra sha256 của mọi file trong snapshot, sai thì raise ValueError"""
+    manifest = manifest or read_manifest(snapshot_dir)
+    if manifest is None:
+        raise ValueError(f"No snapshot with schema version {SCHEMA_VERSION} in {snapshot_dir}")
+    for file_name, checksum in manifest['checksums'].items():
+        if file_sha256(os.path.join(snapshot_dir, file_name)) != checksum:
+            raise ValueError(f"Checksum mismatch for {file_name}")
+    return manifest
+
+
+def _read_column(snapshot_dir, spec, rows):
+    """Đọc một cột: cột số là memmap, cột chuỗi giải mã từ blob memory-map"""
+    if spec['kind'] == 'numeric':
+        return np.load(os.path.join(snapshot_dir, spec['files'][0]), mmap_mode='r')
+
+    column = TextColumn.open(snapshot_dir, spec)
+    if len(column) != rows:
+        raise ValueError(f"Column {spec['files'][0]} has {len(column)} rows, expected {rows}")
+    return pd.Series(column.decode_all()).infer_objects()
+
+
+def load_table(snapshot_dir, manifest, table, lazy_columns=()):
+    """Dựng lại DataFrame của một bảng từ snapshot
+
+    Trả về (DataFrame, {tên cột: TextColumn}); cột trong `lazy_columns` và cột
+    tính sẵn (content_preview) chỉ được memory-map, không đưa vào DataFrame.
+    """
+    spec = manifest['tables'][table]
+    frame = pd.DataFrame({
+        column: _read_column(snapshot_dir, column_spec, spec['rows'])
+        for column, column_spec in spec['columns'].items()
+        if column not in lazy_columns
+    })
+    text_columns = {}
+    if lazy_columns:
+        lazy_specs = {column: spec['columns'][column] for column in lazy_columns if column in spec['columns']}
+        for column, column_spec in {**lazy_specs, **spec['derived']}.items():
+            if column_spec['kind'] != 'string':
+                continue
+            text_columns[column] = TextColumn.open(snapshot_dir, column_spec)
+            if len(text_columns[column]) != spec['rows']:
+                raise ValueError(f"Column {column} has {len(text_columns[column])} rows, expected {spec['rows']}")
+    return frame, text_columns
+
+
+def load_snapshot(book_file, comments_file=None, snapshot_dir=None, verify=VERIFY_ON_LOAD, lazy_columns=()):
+    """Load (book_df, comments_df, manifest, text_columns) từ snapshot còn mới, None nếu phải đọc CSV
+
+    Snapshot thiếu, khác schema version, cũ hơn CSV hoặc hỏng đều trả về None.
+    """
+    snapshot_dir = snapshot_dir or default_snapshot_dir(book_file)
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or not is_snapshot_fresh(manifest, book_file, comments_file):
+        return None
+
+    try:
+        if verify:
+            verify_snapshot(snapshot_dir, manifest)
+        book_df, text_columns = load_table(snapshot_dir, manifest, 'books', lazy_columns)
+        comments_df = load_table(snapshot_dir, manifest, 'comments')[0] if comments_file else None
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Snapshot {snapshot_dir} unusable ({e}), falling back to CSV")
+        return None
+    return book_df, comments_df, manifest, text_columns
+
+
+def read_book_data(book_file, comments_file=None, snapshot_dir=None, lazy_columns=()):
+    """Đọc dữ liệu sách/bình luận: ưu tiên snapshot, không có thì parse CSV
+
+    Trả về (book_df, comments_df, đường dẫn manifest hoặc None, {cột: TextColumn}).
+    Chỉ khi đọc từ snapshot thì các cột `lazy_columns` mới nằm ngoài DataFrame.
+    """
+    snapshot_dir = snapshot_dir or default_snapshot_dir(book_file)
+    loaded = load_snapshot(book_file, comments_file, snapshot_dir, lazy_columns=lazy_columns)
+    if loaded is not None:
+        book_df, comments_df, _, text_columns = loaded
+        return book_df, comments_df, os.path.join(snapshot_dir, MANIFEST_FILE), text_columns
+
+    book_df = pd.read_csv(book_file)
+    comments_df = pd.read_csv(comments_file) if comments_file else None
+    return book_df, comments_df, None, {}
+
+
+def benchmark(book_file, comments_file=None, repeat=3):
+    """So sánh thời gian khởi động lạnh: parse CSV và memory-map snapshot"""
+    from caelio_catalog import BookCatalog
+
+    snapshot_dir = default_snapshot_dir(book_file)
+    if load_snapshot(book_file, comments_file, snapshot_dir) is None:
+        build_snapshot(book_file, comments_file, snapshot_dir)
+
+    def best_of(load):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def from_csv():
+        return {'book_df': pd.read_csv(book_file), 'comments_df': pd.read_csv(comments_file) if comments_file else None}
+
+    def from_snapshot():
+        book_df, comments_df, _, text_columns = load_snapshot(
+            book_file, comments_file, snapshot_dir, lazy_columns=('summary', 'content')
+        )
+        return {'book_df': book_df, 'comments_df': comments_df, 'text_columns': text_columns}
+
+    csv_seconds = best_of(from_csv)
+    snapshot_seconds = best_of(from_snapshot)
+    catalog_csv_seconds = best_of(lambda: BookCatalog(**from_csv()))
+    catalog_snapshot_seconds = best_of(lambda: BookCatalog(**from_snapshot()))
+
+    print(f"📊 Read data:     CSV {csv_seconds:.3f}s | snapshot {snapshot_seconds:.3f}s")
+    print(f"📊 Build catalog: CSV {catalog_csv_seconds:.3f}s | snapshot {catalog_snapshot_seconds:.3f}s")
+    csv_catalog, snapshot_catalog = BookCatalog(**from_csv()), BookCatalog(**from_snapshot())
+    print(f"📊 Catalog heap:  CSV {csv_catalog.memory_bytes / 2**20:.1f}MB | "
+          f"snapshot {snapshot_catalog.memory_bytes / 2**20:.1f}MB")
+    return {
+        'csv_seconds': csv_seconds,
+        'snapshot_seconds': snapshot_seconds,
+        'catalog_csv_seconds': catalog_csv_seconds,
+        'catalog_snapshot_seconds': catalog_snapshot_seconds
+    }
+
+
+def main(argv):
+    from caelio_catalog import BOOK_DATA_FILES, COMMENT_DATA_FILES, resolve_data_file
+
+    command = argv[0] if argv else 'build'
+    book_file = argv[1] if len(argv) > 1 else resolve_data_file(BOOK_DATA_FILES)
+    comments_file = argv[2] if len(argv) > 2 else resolve_data_file(COMMENT_DATA_FILES)
+    if book_file is None:
+        print("❌ Book database not found")
+        return 1
+
+    snapshot_dir = default_snapshot_dir(book_file)
+    if command == 'build':
+        started = time.perf_counter()
+        manifest = build_snapshot(book_file, comments_file, snapshot_dir)
+        rows = {table: spec['rows'] for table, spec in manifest['tables'].items()}
+        print(f"✅ Built snapshot {snapshot_dir} {rows} in {time.perf_counter() - started:.2f}s")
+    elif command == 'verify':
+        verify_snapshot(snapshot_dir)
+        print(f"✅ Snapshot {snapshot_dir} OK")
+    elif command == 'benchmark':
+        benchmark(book_file, comments_file)
+    else:
+        print(f"❌ Unknown command: {command}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
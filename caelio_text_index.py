@@ -0,0 +1,148 @@
+"""
+Index tìm kiếm tương đối (substring) cho danh sách sách: title, authors, category
+Dùng trigram posting list để lọc ứng viên, sau đó kiểm tra lại bằng `in`
+"""
+
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# Độ dài n-gram; truy vấn ngắn hơn sẽ quét tuần tự trên cột đã chuẩn hóa
+NGRAM_SIZE = 3
+
+# Tăng khi đổi cách chuẩn hóa hoặc định dạng posting list; index lưu trong snapshot khác version sẽ bị tính lại
+INDEX_FORMAT = 1
+
+# Cột được index và tên tham số lọc tương ứng của /books
+INDEXED_COLUMNS = {
+    'category': 'category',
+    'author': 'authors',
+    'title': 'title'
+}
+
+
+def normalize_text(value):
+    """Lowercase + chuẩn Unicode NFC để chữ có dấu dựng sẵn/tổ hợp so khớp như nhau"""
+    return unicodedata.normalize('NFC', str(value).lower())
+
+
+def code_points(text):
+    """Mảng code point Unicode của chuỗi (chỉ số giống hệt khi cắt chuỗi Python)"""
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+
+def gram_keys(codes):
+    """Key uint64 của mọi trigram trong một dãy code point: 3 × 21 bit (code point tối đa 0x10FFFF)"""
+    codes = codes.astype(np.uint64)
+    return (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+
+
+class TrigramIndex:
+    """Index trigram cho một cột văn bản
+
+    search(query) trả về vị trí các dòng (tăng dần) có chứa query, giống
+    `column.str.lower().str.contains(query.lower(), na=False, regex=False)`.
+
+    Posting list lưu dạng CSR: keys (trigram, tăng dần), offsets và rows, đều là
+    mảng NumPy nên có thể ghi vào snapshot và memory-map dùng chung giữa các worker.
+    """
+
+    def __init__(self, values, arrays=None):
+        # Giá trị thiếu không bao giờ khớp (na=False), lưu None để phân biệt với chuỗi rỗng
+        self.texts = [normalize_text(value) if pd.notna(value) else None for value in values]
+        if arrays is None:
+            arrays = self.build_postings(self.texts)
+        self.keys, self.offsets, self.rows = arrays['keys'], arrays['offsets'], arrays['rows']
+
+    @staticmethod
+    def build_postings(texts):
+        """Tính CSR posting list cho toàn bộ cột bằng vài phép NumPy trên chuỗi code point nối liền"""
+        encoded = [code_points(text) if text is not None else np.empty(0, dtype=np.uint32) for text in texts]
+        lengths = np.array([len(codes) for codes in encoded], dtype=np.int64)
+        codes = np.concatenate(encoded) if encoded else np.empty(0, dtype=np.uint32)
+        row_of_code = np.repeat(np.arange(len(texts), dtype=np.int32), lengths)
+
+        if len(codes) >= NGRAM_SIZE:
+            # Chỉ giữ trigram nằm trọn trong một dòng
+            within_row = row_of_code[:-2] == row_of_code[2:]
+            keys = gram_keys(codes)[within_row]
+            rows = row_of_code[:-2][within_row]
+        else:
+            keys = np.empty(0, dtype=np.uint64)
+            rows = np.empty(0, dtype=np.int32)
+
+        # Sắp theo (trigram, dòng) rồi bỏ cặp trùng (trigram lặp lại trong cùng một dòng)
+        order = np.lexsort((rows, keys))
+        keys, rows = keys[order], rows[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])
+        keys, rows = keys[distinct], rows[distinct]
+
+        unique_keys, starts = np.unique(keys, return_index=True)
+        return {
+            'keys': unique_keys,
+            'offsets': np.append(starts, len(keys)).astype(np.int64),
+            'rows': rows
+        }
+
+    def arrays(self):
+        """Các mảng CSR để lưu vào snapshot"""
+        return {'keys': self.keys, 'offsets': self.offsets, 'rows': self.rows}
+
+    def search(self, query):
+        """Vị trí các dòng chứa query"""
+        query = normalize_text(query)
+        texts = self.texts
+
+        if len(query) < NGRAM_SIZE:
+            rows = [row for row, text in enumerate(texts) if text is not None and query in text]
+            return np.array(rows, dtype=np.int64)
+
+        # Mọi trigram của query phải có trong index
+        query_keys = np.unique(gram_keys(code_points(query)))
+        slots = np.searchsorted(self.keys, query_keys)
+        if np.any(slots >= len(self.keys)) or np.any(self.keys[np.minimum(slots, len(self.keys) - 1)] != query_keys):
+            return np.array([], dtype=np.int64)
+
+        # Giao các posting list, bắt đầu từ list ngắn nhất
+        posting_lists = [self.rows[self.offsets[slot]:self.offsets[slot + 1]] for slot in slots]
+        posting_lists.sort(key=len)
+
+        candidates = posting_lists[0]
+        for rows in posting_lists[1:]:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates.astype(np.int64)
+
+        # Trigram chỉ là điều kiện cần, kiểm tra lại substring thật
+        return np.array([row for row in candidates if query in texts[row]], dtype=np.int64)
+
+
+class BookTextIndex:
+    """Index cho các bộ lọc category/author/title của /books"""
+
+    def __init__(self, book_df, arrays=None):
+        """arrays: {tên bộ lọc: mảng CSR} đã tính sẵn (từ snapshot), thiếu thì tự tính"""
+        self.total = len(book_df)
+        arrays = arrays or {}
+        self.indexes = {
+            name: TrigramIndex(book_df[column] if column in book_df.columns else [None] * len(book_df), arrays.get(name))
+            for name, column in INDEXED_COLUMNS.items()
+        }
+
+    def arrays(self):
+        """{tên bộ lọc: mảng CSR} để lưu vào snapshot"""
+        return {name: index.arrays() for name, index in self.indexes.items()}
+
+    def filter(self, category=None, author=None, title=None):
+        """Vị trí các sách thỏa mọi bộ lọc (theo thứ tự gốc), không tạo bản sao DataFrame"""
+        positions = None
+        for name, query in (('category', category), ('author', author), ('title', title)):
+            if not query:
+                continue
+            rows = self.indexes[name].search(query)
+            positions = rows if positions is None else np.intersect1d(positions, rows, assume_unique=True)
+
+        if positions is None:
+            return np.arange(self.total, dtype=np.int64)
+        return positions
@@ -7,6 +7,7 @@ import streamlit as st
 import pandas as pd
 from caelio_personality_system import CaelioPersonalitySystem
 from caelio_book_matcher import CaelioBookMatcher
+from caelio_snapshot import read_book_data
 
 # Cấu hình trang
 st.set_page_config(
@@ -228,7 +229,7 @@ def show_book_recommendations(profile, book_matcher):
     
     try:
         # Load dữ liệu sách
-        book_df = pd.read_csv('dataset/books_full_data.csv')
+        book_df = read_book_data('dataset/books_full_data.csv')[0]
         
         # Lấy gợi ý
         result = book_matcher.get_personalized_recommendations(
@@ -0,0 +1,127 @@
+"""
+Giới hạn tải cho các endpoint nặng CPU của Caelio API
+Endpoint nặng chạy trong thread pool của anyio (kích thước cấu hình được), số
+request đang chạy + đang chờ bị chặn ở một ngưỡng; vượt ngưỡng thì trả 503 thay
+vì xếp hàng vô hạn. Độ trễ event loop được đo liên tục để xem qua /metrics.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+# Số thread chạy endpoint nặng cùng lúc
+WORKER_THREADS = int(os.environ.get('CAELIO_WORKER_THREADS', '4'))
+
+# Số request được phép chờ thread; vượt quá thì trả 503
+QUEUE_DEPTH = int(os.environ.get('CAELIO_WORKER_QUEUE_DEPTH', '64'))
+
+# Chu kỳ lấy mẫu độ trễ event loop (giây) và số mẫu giữ lại
+LAG_SAMPLE_INTERVAL = float(os.environ.get('CAELIO_LAG_SAMPLE_INTERVAL', '0.1'))
+LAG_WINDOW = 600
+
+
+def configure_worker_threads(threads=WORKER_THREADS):
+    """Đặt số thread của pool mặc định anyio (FastAPI chạy endpoint `def` trong pool này)
+
+    Phải gọi bên trong event loop (startup event). Trả về limiter để đọc thống kê.
+    """
+    import anyio.to_thread
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = threads
+    return limiter
+
+
+class AdmissionControl:
+    """Đếm request nặng đang chạy + đang chờ, từ chối khi vượt workers + queue_depth
+
+    Chỉ được gọi từ event loop nên không cần lock.
+    """
+
+    def __init__(self, workers=WORKER_THREADS, queue_depth=QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.limiter = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def limit(self):
+        return self.workers + self.queue_depth
+
+    def try_acquire(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self):
+        stats = {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'admitted': self.admitted,
+            'rejected': self.rejected
+        }
+        if self.limiter is not None:
+            stats['busy_threads'] = int(self.limiter.borrowed_tokens)
+            stats['waiting'] = self.limiter.statistics().tasks_waiting
+        return stats
+
+
+class EventLoopLagMonitor:
+    """Đo độ trễ event loop: ngủ `interval` giây rồi xem loop thức dậy muộn bao nhiêu"""
+
+    def __init__(self, interval=LAG_SAMPLE_INTERVAL, window=LAG_WINDOW):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.total_samples = 0
+        self.started_at = None
+        self._task = None
+
+    def record(self, lag):
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        self.total_samples += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+
+    def start(self):
+        if self._task is None:
+            self.started_at = time.time()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        """Độ trễ (ms) trên LAG_WINDOW mẫu gần nhất; max_ms tính từ lúc khởi động"""
+        recent = sorted(self.samples)
+        if not recent:
+            return {'interval_ms': self.interval * 1000, 'samples': 0}
+        return {
+            'interval_ms': self.interval * 1000,
+            'samples': self.total_samples,
+            'last_ms': round(self.samples[-1] * 1000, 3),
+            'mean_ms': round(sum(recent) / len(recent) * 1000, 3),
+            'p99_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.99))] * 1000, 3),
+            'max_ms': round(self.max_lag * 1000, 3)
+        }
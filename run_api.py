@@ -1,20 +1,84 @@
 """
 Script để chạy Caelio API
+
+    python run_api.py                # một process
+    python run_api.py --workers 4    # nhiều worker dùng chung snapshot catalog (memory-map)
+
+Với nhiều worker, snapshot dạng cột cùng ma trận keyword, index lọc và atlas
+profile được build một lần trước khi tạo worker; mỗi worker chỉ memory-map các file này
+nên phần dữ liệu lớn nằm một lần trong page cache của hệ điều hành.
 """
 
+import argparse
+import multiprocessing
+import os
 import uvicorn
-from caelio_api import app
+
+
+def prepare_shared_catalog():
+    """Build snapshot (nếu thiếu hoặc cũ), các mảng tính sẵn của catalog và atlas profile"""
+    from caelio_atlas import ensure_atlas
+    from caelio_personality_system import CaelioPersonalitySystem
+    from caelio_catalog import BOOK_DATA_FILES, COMMENT_DATA_FILES, load_catalog, resolve_data_file
+    from caelio_snapshot import build_snapshot, default_snapshot_dir, is_snapshot_fresh, read_manifest
+
+    ensure_atlas(CaelioPersonalitySystem())
+
+    book_file = resolve_data_file(BOOK_DATA_FILES)
+    if book_file is None:
+        print("⚠️ Book database not found, book endpoints will return 404")
+        return
+    comments_file = resolve_data_file(COMMENT_DATA_FILES)
+
+    snapshot_dir = default_snapshot_dir(book_file)
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or not is_snapshot_fresh(manifest, book_file, comments_file):
+        print(f"🧱 Building catalog snapshot in {snapshot_dir}...")
+        build_snapshot(book_file, comments_file, snapshot_dir)
+
+    # Lần load đầu từ snapshot ghi ma trận keyword và index lọc vào snapshot
+    catalog = load_catalog(book_file, comments_file)
+    print(f"📚 Shared catalog ready: {len(catalog)} books in {snapshot_dir}")
+
+
+def prepare_in_subprocess():
+    """Chuẩn bị catalog trong process riêng để process quản lý worker không giữ bản catalog nào"""
+    process = multiprocessing.get_context('spawn').Process(target=prepare_shared_catalog)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        print("⚠️ Could not prepare shared catalog snapshot, each worker will load the catalog itself")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Caelio Personality API")
+    parser.add_argument('--host', default=os.environ.get('CAELIO_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('CAELIO_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CAELIO_WORKERS', '1')),
+                        help="số process worker (mặc định CAELIO_WORKERS hoặc 1)")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
+    # Dữ liệu sách được reload nóng bởi CatalogWatcher, chỉ bật reload code khi dev
+    reload = os.environ.get('CAELIO_DEV_RELOAD') == '1'
+    workers = 1 if reload else max(1, args.workers)
+
     print("🚀 Starting Caelio Personality API...")
-    print("📖 Docs: http://localhost:8000/docs")
-    print("🔧 ReDoc: http://localhost:8000/redoc") 
-    print("⚡ API: http://localhost:8000")
-    
+    print(f"📖 Docs: http://localhost:{args.port}/docs")
+    print(f"🔧 ReDoc: http://localhost:{args.port}/redoc")
+    print(f"⚡ API: http://localhost:{args.port}")
+
+    if workers > 1:
+        print(f"👥 {workers} workers sharing one memory-mapped catalog snapshot")
+        prepare_in_subprocess()
+
     uvicorn.run(
         "caelio_api:app",
-        host="0.0.0.0", 
-        port=8000,
-        reload=True,  # Auto reload khi code thay đổi
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        reload=reload,
         log_level="info"
-    )
\ No newline at end of file
+    )
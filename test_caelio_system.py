@@ -169,6 +169,176 @@ def test_book_matching():
     print("✅ PASS: Book matching chính xác!")
     return result
 
+def test_category_scores_match_per_book():
+    """Điểm tính theo category khớp với chấm điểm từng sách"""
+    matcher = CaelioBookMatcher()
+    
+    sample_books = [
+        {'product_id': 1, 'title': 'Cây Cam Ngọt Của Tôi', 'category': 'Tiểu Thuyết'},
+        {'product_id': 2, 'title': 'Thao Túng Tâm Lý', 'category': 'Sách tư duy - Kỹ năng sống'},
+        {'product_id': 3, 'title': 'Marketing 4.0', 'category': 'Sách Marketing - Bán hàng'},
+        {'product_id': 4, 'title': 'Không rõ thể loại', 'category': None},
+        {'product_id': 5, 'title': 'Triết Học Phương Đông', 'category': 'Triết học'},
+        {'product_id': 6, 'title': 'Nhà Giả Kim', 'category': 'Tiểu Thuyết'},
+    ]
+    book_df = pd.DataFrame(sample_books)
+    
+    for group in matcher.personality_to_categories:
+        for is_synthesizer in [False, True]:
+            profile = {'primary_group': group, 'is_synthesizer': is_synthesizer}
+            result = matcher.map_personality_to_books(profile, book_df)
+            
+            targets = matcher._target_categories(group, is_synthesizer)
+            expected = {
+                row['product_id']: matcher._calculate_match_score_fuzzy(row['category'], group, is_synthesizer, targets)
+                for _, row in book_df.iterrows()
+                if matcher._matches_any_target(row['category'], targets)
+            }
+            actual = dict(zip(result['product_id'], result['personality_match_score']))
+            assert actual == expected, f"Sai điểm cho nhóm {group} (synthesizer={is_synthesizer})"
+    
+    print("\n✅ PASS: Điểm theo category khớp với chấm điểm từng sách!")
+
+def test_quiz_session_incremental_profile():
+    """Phiên làm bài cập nhật từng câu cho profile giống tính lại từ đầu, kể cả khi sửa câu trả lời"""
+    import random
+    import time
+    from caelio_sessions import SessionStore
+    
+    system = CaelioPersonalitySystem()
+    store = SessionStore(system)
+    random.seed(7)
+    
+    for _ in range(300):
+        session = store.create()
+        answered = {}
+        for _ in range(12):
+            q_id = random.choice(list(system.discovery_questions))
+            choice = random.choice(list(system.discovery_questions[q_id]['choices']))
+            session.answer(q_id, choice)
+            answered[q_id] = choice
+            assert session.profile() == system.calculate_discovery_profile(answered)
+        assert session.answers == answered
+    
+    # Phiên hết hạn sau TTL, vượt quá số phiên tối đa thì bỏ phiên lâu không dùng nhất
+    store = SessionStore(system, ttl=0.05, max_sessions=2)
+    first, second = store.create(), store.create()
+    assert store.get(first.session_id) is first
+    third = store.create()
+    assert store.get(second.session_id) is None and store.stats()['evicted'] == 1
+    time.sleep(0.06)
+    assert store.get(first.session_id) is None and store.get(third.session_id) is None
+    assert store.stats()['expired'] == 2
+    
+    print("\n✅ PASS: Phiên làm bài cập nhật profile từng câu!")
+
+def test_partial_profile_table():
+    """Profile sơ bộ tra bảng giống tính trực tiếp trên 3 câu WHY; phân bố profile đầy đủ có tổng bằng 1"""
+    import itertools
+    system = CaelioPersonalitySystem()
+    
+    why_choices = [system.discovery_questions[q]['choices'] for q in ('Q1', 'Q2', 'Q3')]
+    combos = list(itertools.product(*why_choices))
+    assert len(system.partial_profiles) == len(combos) == 125
+    for combo in combos:
+        answers = dict(zip(('Q1', 'Q2', 'Q3'), combo))
+        assert system.calculate_partial_profile(answers) == system.calculate_discovery_profile(answers)
+    
+    # Bản trả về là bản sao, sửa không ảnh hưởng bảng
+    answers = {'Q1': 'C', 'Q2': 'D', 'Q3': 'E'}
+    system.calculate_partial_profile(answers)['all_scores']['Tri thức'] = 99
+    assert system.calculate_partial_profile(answers)['all_scores']['Tri thức'] == 1
+    
+    for bad in ({'Q1': 'C', 'Q2': 'D'}, {'Q1': 'C', 'Q2': 'D', 'Q4': 'A'}, {'Q1': 'Z', 'Q2': 'D', 'Q3': 'E'}):
+        try:
+            system.calculate_partial_profile(bad)
+            assert False, f"Phải báo lỗi với {bad}"
+        except ValueError:
+            pass
+    
+    distribution = system.full_profile_distribution(answers)
+    assert abs(sum(distribution.values()) - 1) < 1e-9
+    assert list(distribution.values()) == sorted(distribution.values(), reverse=True)
+    full_example = {'Q1': 'C', 'Q2': 'D', 'Q3': 'E', 'Q4': 'C', 'Q5': 'B', 'Q6': 'E', 'Q7': 'C', 'Q8': 'C'}
+    assert system.calculate_discovery_profile(full_example)['profile_name'] in distribution
+    
+    print("\n✅ PASS: Profile sơ bộ tra bảng Q1-Q3!")
+
+def test_discovery_profiles_batch_matches_scalar():
+    """Tính profile theo lô (NumPy) giống hệt calculate_discovery_profile trên toàn bộ không gian câu trả lời"""
+    import itertools
+    import numpy as np
+    system = CaelioPersonalitySystem()
+    
+    answer_sets = [
+        dict(zip(system.discovery_question_ids, combo))
+        for combo in itertools.product(*system.discovery_choice_codes)
+    ]
+    codes = system.encode_discovery_answers(answer_sets)
+    assert codes.shape == (84375, 8)
+    batch = system.calculate_discovery_profiles_batch(codes)
+    for index, answers in enumerate(answer_sets):
+        assert system.profile_from_batch(batch, index) == system.calculate_discovery_profile(answers), answers
+    
+    for bad in (np.zeros((2, 7), dtype=np.uint8), np.array([[0, 0, 0, 3, 0, 0, 0, 0]]), np.array([[-1] * 8])):
+        try:
+            system.calculate_discovery_profiles_batch(bad)
+            assert False, f"Phải báo lỗi với {bad}"
+        except ValueError:
+            pass
+    try:
+        system.encode_discovery_answers([{'Q1': 'A'}])
+        assert False, "Phải báo lỗi khi thiếu câu trả lời"
+    except ValueError:
+        pass
+    
+    print("\n✅ PASS: Profile theo lô khớp từng bộ câu trả lời!")
+
+def test_profile_atlas_resolver():
+    """Atlas toàn không gian câu trả lời tra ra đúng profile của calculate_discovery_profile"""
+    import json
+    import os
+    import random
+    import tempfile
+    import numpy as np
+    from caelio_atlas import answer_space_codes, atlas_report, build_atlas, load_atlas
+    
+    system = CaelioPersonalitySystem()
+    with tempfile.TemporaryDirectory() as atlas_dir:
+        assert load_atlas(system, atlas_dir) is None
+        manifest = build_atlas(system, atlas_dir)
+        atlas = load_atlas(system, atlas_dir)
+        assert len(atlas) == manifest['combinations'] == 84375
+        assert isinstance(atlas.atlas, np.memmap) and atlas.atlas.dtype == np.uint16
+        
+        # Mã profile theo lô khớp với profile tính theo lô trên toàn không gian
+        codes = answer_space_codes(system)
+        batch = system.calculate_discovery_profiles_batch(codes)
+        ids = atlas.profile_ids(codes)
+        for index in range(0, len(codes), 97):
+            assert atlas.profile_dicts[ids[index]] == system.profile_from_batch(batch, index)
+        
+        random.seed(11)
+        for _ in range(2000):
+            answers = {q_id: random.choice(list(question['choices'])) for q_id, question in system.discovery_questions.items()}
+            assert atlas.resolve(answers) == system.calculate_discovery_profile(answers)
+        
+        report = atlas_report(atlas)
+        assert report['combinations'] == 84375
+        assert abs(sum(report['primary_group'].values()) - 1) < 1e-3
+        assert 0 < report['synthesizer_share'] < report['multi_motivated_share'] <= 1
+        
+        # Bộ câu hỏi đổi thì atlas cũ bị bỏ qua
+        manifest_path = os.path.join(atlas_dir, 'manifest.json')
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['fingerprint'] = 'stale'
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        assert load_atlas(system, atlas_dir) is None
+    
+    print("\n✅ PASS: Atlas profile tra đúng toàn không gian câu trả lời!")
+
 def run_all_tests():
     """Chạy tất cả test cases"""
     print("🧪 CHẠY TẤT CẢ TEST CASES")
@@ -180,6 +350,11 @@ def run_all_tests():
         test_tie_breaker()
         test_synthesizer_conditions()
         test_book_matching()
+        test_category_scores_match_per_book()
+        test_quiz_session_incremental_profile()
+        test_partial_profile_table()
+        test_discovery_profiles_batch_matches_scalar()
+        test_profile_atlas_resolver()
         
         print("\n🎉 TẤT CẢ TEST CASES PASSED!")
         print("Hệ thống hoạt động chính xác theo tài liệu.")